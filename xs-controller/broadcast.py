@@ -0,0 +1,170 @@
+import asyncio, logging, os, time
+from fastapi import WebSocket, WebSocketDisconnect
+from utils import codec
+
+log = logging.getLogger("Broadcast")
+
+WS_TICK_MS = int(os.getenv("WS_TICK_MS", 100))
+WS_CLIENT_QUEUE = int(os.getenv("WS_CLIENT_QUEUE", 64))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", 5))
+
+
+def topic_matches(pattern, topic):
+    """MQTT-style topic match: `+` matches one level, `#` matches the rest."""
+    if pattern == topic or pattern == "#":
+        return True
+    p_parts, t_parts = pattern.split("/"), topic.split("/")
+    for i, p in enumerate(p_parts):
+        if p == "#":
+            return True
+        if i >= len(t_parts) or (p != "+" and p != t_parts[i]):
+            return False
+    return len(p_parts) == len(t_parts)
+
+
+def _split(value):
+    if not value:
+        return None
+    items = value if isinstance(value, list) else str(value).split(",")
+    return [str(v).strip() for v in items if v is not None and str(v).strip()] or None
+
+
+class Client:
+    """One WebSocket subscriber: its filters and a bounded queue of outgoing frames."""
+
+    def __init__(self, ws, edges=None, topics=None, queue_size=WS_CLIENT_QUEUE):
+        self.ws = ws
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.sent = 0
+        self.connected_at = time.time()
+        self.set_filter(edges, topics)
+
+    def set_filter(self, edges=None, topics=None):
+        self.edges = frozenset(_split(edges) or ()) or None
+        self.topics = tuple(_split(topics) or ()) or None
+        self.key = (self.edges, self.topics)        # clients with equal filters share a frame
+
+    def wants(self, edge_id, topic):
+        if self.edges is not None and edge_id not in self.edges:
+            return False
+        return self.topics is None or any(topic_matches(p, topic) for p in self.topics)
+
+
+class BroadcastHub:
+    """
+    Fans parsed telemetry out to WebSocket clients without touching ingestion.
+
+    publish() is synchronous and cheap: each message is serialized once and
+    buffered. Every `tick` the buffer is turned into one frame per distinct
+    client filter ({"messages": [...]}, built by joining the pre-encoded
+    messages) and offered to each client's bounded queue. A sender task per
+    client does the actual send; a client whose queue is full, or whose send
+    takes longer than `send_timeout`, is disconnected instead of slowing the
+    others down. Clients declare filters with ?edge_id=a,b&topics=net/#
+    (MQTT wildcards) on connect, or later by sending
+    {"subscribe": {"edge_id": [...], "topics": [...]}}.
+    """
+
+    def __init__(self, tick_ms=WS_TICK_MS, queue_size=WS_CLIENT_QUEUE, send_timeout=WS_SEND_TIMEOUT):
+        self.tick = tick_ms / 1000
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.clients = set()
+        self._buffer = []               # (edge_id, topic, encoded message)
+        self._task = None
+        self.stats = {"published": 0, "frames": 0, "frames_built": 0, "messages_sent": 0,
+                      "clients_dropped": 0, "clients_total": 0, "batches_failed": 0}
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def publish(self, message):
+        """Buffer one parsed message ({"edge_id", "topic", "data"}) for the next tick."""
+        self.stats["published"] += 1
+        if self.clients:
+            self._buffer.append((message.get("edge_id"), str(message.get("topic")), codec.dumps_str(message)))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            if not self._buffer:
+                continue
+            batch, self._buffer = self._buffer, []
+            try:
+                self._fan_out(batch)
+            except Exception as e:
+                self.stats["batches_failed"] += 1
+                log.error(f"[WS] Dropped a batch of {len(batch)} messages: {e!r}")
+
+    def _fan_out(self, batch):
+        frames = {}
+        for client in list(self.clients):
+            frame = frames.get(client.key)
+            if frame is None:
+                parts = [enc for edge_id, topic, enc in batch if client.wants(edge_id, topic)]
+                frame = frames[client.key] = (
+                    ('{"messages":[' + ",".join(parts) + "]}", len(parts)) if parts else ("", 0))
+                self.stats["frames_built"] += 1
+            if not frame[1]:
+                continue
+            try:
+                client.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                self._drop(client, "queue full")
+
+    # ───────────────────────────────────────────────────────────────
+    async def serve(self, ws: WebSocket):
+        """Run one WebSocket connection until it closes or is dropped as slow."""
+        await ws.accept()
+        client = Client(ws, ws.query_params.get("edge_id"), ws.query_params.get("topics"), self.queue_size)
+        self.clients.add(client)
+        self.stats["clients_total"] += 1
+        sender = asyncio.create_task(self._send(client))
+        try:
+            while True:
+                msg = codec.loads(await ws.receive_text())
+                sub = msg.get("subscribe") if isinstance(msg, dict) else None
+                if isinstance(sub, dict):
+                    client.set_filter(sub.get("edge_id"), sub.get("topics"))
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            log.debug(f"[WS] Client receive loop ended: {e}")
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+
+    async def _send(self, client):
+        try:
+            while True:
+                frame, count = await client.queue.get()
+                await asyncio.wait_for(client.ws.send_text(frame), self.send_timeout)
+                client.sent += count
+                self.stats["frames"] += 1
+                self.stats["messages_sent"] += count
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self._drop(client, f"send took over {self.send_timeout:.0f} s")
+        except Exception:
+            self.clients.discard(client)
+
+    def _drop(self, client, reason):
+        if client not in self.clients:
+            return
+        self.clients.discard(client)
+        self.stats["clients_dropped"] += 1
+        log.warning(f"[WS] Dropping slow client {client.ws.client}: {reason}")
+        asyncio.create_task(self._close(client.ws))
+
+    @staticmethod
+    async def _close(ws):
+        try:
+            await asyncio.wait_for(ws.close(code=1013, reason="too slow"), 1)
+        except Exception:
+            pass
+
+    def get_stats(self):
+        return dict(self.stats, clients=len(self.clients), buffered=len(self._buffer),
+                    queued=sum(c.queue.qsize() for c in self.clients))
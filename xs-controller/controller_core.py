@@ -5,6 +5,7 @@ from sqlmodel import SQLModel
 from routes import edges, telemetry, commands, auth
 from utils.security import SecureAgent
 from mqtt_server import MQTTServer
+from broadcast import BroadcastHub
 from models import engine
 from routes import rules
 
@@ -28,29 +29,38 @@ app.include_router(commands.router, prefix="/commands", tags=["Commands"])
 app.include_router(rules.router, prefix="/rules", tags=["Rules"])
 app.include_router(auth.router, prefix="/auth", tags=["Auth"])
 
-ws_clients = set()
+hub = BroadcastHub()
 sa = SecureAgent()
 mqtt_server = MQTTServer(broker=os.getenv("MQTT_BROKER", "test.mosquitto.org"), port=int(os.getenv("MQTT_PORT", 1883)))
 
 @app.on_event("startup")
 async def startup_event():
     SQLModel.metadata.create_all(engine)
-    asyncio.create_task(mqtt_server.listen_and_store(ws_clients))
+    hub.start()
+    asyncio.create_task(mqtt_server.listen_and_store(hub))
     log.info("🚀 XS Controller started and MQTT listener running")
 
+@app.get("/ingest/stats", tags=["Telemetry"])
+async def ingest_stats():
+    """Ingest pipeline throughput, queue depth and batch write latency."""
+    return mqtt_server.ingest.get_stats()
+
+@app.get("/ws/stats", tags=["Telemetry"])
+async def ws_stats():
+    """Live WebSocket clients, frames sent and slow clients dropped."""
+    return hub.get_stats()
+
 @app.websocket("/ws/telemetry")
 async def telemetry_ws(ws: WebSocket):
-    await ws.accept()
-    ws_clients.add(ws)
-    try:
-        while True:
-            await asyncio.sleep(1)
-    except Exception:
-        pass
-    finally:
-        ws_clients.remove(ws)
-        await ws.close()
+    """
+    Live telemetry, batched per tick as {"messages": [...]}.
+    Optional filters: ?edge_id=a,b&topics=network/#,alert/+ — or send
+    {"subscribe": {"edge_id": [...], "topics": [...]}} at any time.
+    """
+    await hub.serve(ws)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("controller_core:app", host="0.0.0.0", port=int(os.getenv("API_PORT", 9000)), reload=False)
+    # EVENT_LOOP: asyncio | uvloop | auto (uvloop when installed)
+    uvicorn.run("controller_core:app", host="0.0.0.0", port=int(os.getenv("API_PORT", 9000)), reload=False,
+                loop=os.getenv("EVENT_LOOP", "asyncio").lower())
@@ -0,0 +1,276 @@
+import asyncio, collections, datetime, logging, os, time
+from sqlalchemy import insert, update
+from models import Edge, Telemetry, TelemetrySummary, engine
+from models_ext import CommandLog
+from utils import codec
+from utils.frames import decode_frame, DeltaDecoder, BATCH_TOPIC
+
+log = logging.getLogger("Ingest")
+
+INGEST_QUEUE = int(os.getenv("INGEST_QUEUE", 10000))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 1))
+INGEST_BATCH = int(os.getenv("INGEST_BATCH", 500))
+INGEST_FLUSH_MS = int(os.getenv("INGEST_FLUSH_MS", 200))
+
+
+class IngestPipeline:
+    """
+    Staged telemetry ingestion:
+
+        MQTT receive → bounded queue → parse workers → batch writer (thread)
+
+    submit() only enqueues the raw message, so the MQTT loop never waits on
+    parsing or SQLite; when the queue is full the message is dropped and
+    counted. Workers decode payloads / batch frames and apply deltas — with
+    no await between dequeue and decoding, so per-edge order holds for any
+    worker count. Parsed rows are written by a single writer in a thread,
+    up to `batch_size` rows per transaction, at least every `flush_ms`.
+    Parsed-but-unwritten rows are capped at four batches; past that the
+    workers wait and the queue absorbs (then drops) the excess.
+    """
+
+    def __init__(self, on_message=None, queue_size=INGEST_QUEUE, workers=INGEST_WORKERS,
+                 batch_size=INGEST_BATCH, flush_ms=INGEST_FLUSH_MS):
+        self.on_message = on_message        # callable(message) after a message is parsed; must not block
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.max_pending = batch_size * 4
+        self.deltas = DeltaDecoder()
+        self.pending = []                   # parsed ops waiting for the writer
+        self._flush = asyncio.Event()
+        self._room = asyncio.Event()
+        self._room.set()
+        self._tasks = []
+        self._recent = collections.deque(maxlen=1000)   # (time, rows) per written batch
+        self.started = time.time()
+        self.stats = {"received": 0, "dropped": 0, "parsed": 0, "parse_errors": 0, "skipped": 0,
+                      "callback_errors": 0, "stored": 0, "batches": 0, "write_errors": 0, "rows_lost": 0,
+                      "last_batch_rows": 0, "batch_ms_avg": 0.0, "batch_ms_max": 0.0}
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._parse_worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._writer()))
+        return self
+
+    # ───────────────────────────────────────────────────────────────
+    # RECEIVE
+    # ───────────────────────────────────────────────────────────────
+    def submit(self, topic, payload):
+        """Enqueue one raw MQTT message. Returns False if it was dropped."""
+        self.stats["received"] += 1
+        try:
+            self.queue.put_nowait((topic, payload))
+            return True
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            if self.stats["dropped"] % 1000 == 1:
+                log.warning(f"[Ingest] Queue full ({self.queue.maxsize}) — {self.stats['dropped']} messages dropped so far")
+            return False
+
+    # ───────────────────────────────────────────────────────────────
+    # PARSE
+    # ───────────────────────────────────────────────────────────────
+    async def _parse_worker(self):
+        while True:
+            topic, payload = await self.queue.get()
+            try:
+                ops, messages = self._parse(topic, payload)
+                self.stats["parsed"] += 1
+            except Exception as e:
+                self.stats["parse_errors"] += 1
+                log.error(f"[Ingest] Parse error on {topic}: {e}")
+                continue
+            finally:
+                self.queue.task_done()
+            if ops:
+                self.pending.extend(ops)
+                if len(self.pending) >= self.batch_size:
+                    self._flush.set()
+            if self.on_message:
+                for m in messages:
+                    try:
+                        self.on_message(m)
+                    except Exception as e:
+                        self.stats["callback_errors"] += 1
+                        log.error(f"[Ingest] on_message failed for {m.get('topic')}: {e}")
+            if len(self.pending) >= self.max_pending:
+                self._room.clear()
+                await self._room.wait()
+
+    def _parse(self, topic, payload):
+        """
+        Decode one MQTT message into finished DB ops. Returns (ops, messages
+        to broadcast); nothing reaches `pending` unless the whole message decoded.
+        """
+        ops, out = [], []
+        if topic == "xsedge/register":
+            p = codec.loads(payload)
+            if p.get("edge_id"):
+                ops.append(("register", p["edge_id"], p.get("version", "unknown")))
+            return ops, out
+        if topic.endswith(f"/{BATCH_TOPIC}"):
+            frame = decode_frame(payload)
+            edge_id = frame.get("edge_id")
+            for t, ts, data in frame.get("messages", []):
+                self._telemetry(ops, out, edge_id, t, data, ts)
+            log.debug(f"[Ingest] Unbatched {len(frame.get('messages', []))} msgs from {edge_id}")
+            return ops, out
+        p = codec.loads(payload)
+        self._telemetry(ops, out, p.get("edge_id"), p.get("topic", "unknown"), p.get("data", {}))
+        return ops, out
+
+    def _telemetry(self, ops, out, edge_id, topic, data, ts=None):
+        data = self.deltas.apply(edge_id, topic, data)
+        if data is None or not edge_id:
+            self.stats["skipped"] += 1
+            log.debug(f"[Ingest] Skipped message from {edge_id} topic={topic}")
+            return
+        topic = str(topic)
+        if topic.startswith("summary/"):
+            try:
+                ops.append(("summary", summary_rows(edge_id, topic, data)))
+            except (KeyError, TypeError, ValueError, AttributeError, OverflowError, OSError) as e:
+                self.stats["parse_errors"] += 1
+                log.error(f"[Ingest] Malformed summary {topic} from {edge_id}: {e!r}")
+                return
+        else:
+            row = {"edge_id": edge_id, "topic": topic, "data": codec.dumps_str(data),
+                   "ts": datetime.datetime.utcfromtimestamp(ts) if ts else datetime.datetime.utcnow()}
+            ack = None
+            if "ack" in topic and isinstance(data, dict):
+                try:
+                    ack = ack_values(data)
+                except (KeyError, TypeError, ValueError) as e:
+                    self.stats["parse_errors"] += 1
+                    log.error(f"[Ingest] Malformed ACK {topic} from {edge_id}: {e!r}")
+            ops.append(("telemetry", row, ack))
+        out.append({"edge_id": edge_id, "topic": topic, "data": data})
+
+    # ───────────────────────────────────────────────────────────────
+    # WRITE
+    # ───────────────────────────────────────────────────────────────
+    async def _writer(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush.clear()
+            while self.pending:
+                batch = self.pending[:self.batch_size]
+                del self.pending[:self.batch_size]
+                if len(self.pending) < self.max_pending:
+                    self._room.set()
+                await self._write(batch)
+
+    async def _write(self, batch):
+        started = time.perf_counter()
+        for attempt in (1, 2):
+            try:
+                rows = await asyncio.to_thread(self._write_batch, batch)
+                break
+            except Exception as e:
+                self.stats["write_errors"] += 1
+                log.error(f"[Ingest] Batch write failed ({len(batch)} ops, attempt {attempt}): {e}")
+                if attempt == 2:
+                    self.stats["rows_lost"] += len(batch)
+                    return
+                await asyncio.sleep(1)
+        ms = (time.perf_counter() - started) * 1000
+        st = self.stats
+        st["batches"] += 1
+        st["stored"] += rows
+        st["last_batch_rows"] = rows
+        st["batch_ms_avg"] += (ms - st["batch_ms_avg"]) / st["batches"]
+        st["batch_ms_max"] = max(st["batch_ms_max"], ms)
+        self._recent.append((time.time(), rows))
+
+    @staticmethod
+    def _write_batch(batch):
+        """Runs in a worker thread: one transaction for the whole batch. Returns rows stored."""
+        now = datetime.datetime.utcnow()
+        telemetry, summaries, acks, registrations = [], [], [], []
+        for op in batch:
+            if op[0] == "register":
+                registrations.append(op[1:])
+            elif op[0] == "summary":
+                summaries.extend(op[1])
+            else:
+                telemetry.append(op[1])
+                if op[2] is not None:
+                    acks.append(op[2])
+
+        with engine.begin() as conn:
+            if telemetry:
+                conn.execute(insert(Telemetry), telemetry)
+            if summaries:
+                conn.execute(insert(TelemetrySummary), summaries)
+            for edge_id, version in registrations:
+                seen = conn.execute(update(Edge).where(Edge.edge_id == edge_id)
+                                    .values(last_seen=now, status="ONLINE"))
+                if seen.rowcount == 0:
+                    conn.execute(insert(Edge).values(edge_id=edge_id, version=version, last_seen=now, status="ONLINE"))
+                log.info(f"[REGISTER] Edge {edge_id} registered (v{version})")
+            for ack in acks:
+                conn.execute(update(CommandLog).where(CommandLog.cmd_id == ack["cmd_id"]).values(
+                    status=ack["status"], result=ack["result"], ts_ack=now))
+                log.info(f"[ACK] Command {ack['cmd_id']} acknowledged: {ack['result']}")
+        return len(telemetry) + len(summaries)
+
+    # ───────────────────────────────────────────────────────────────
+    def get_stats(self):
+        now = time.time()
+        recent = sum(n for t, n in self._recent if t > now - 10)
+        return dict(
+            self.stats,
+            batch_ms_avg=round(self.stats["batch_ms_avg"], 2),
+            batch_ms_max=round(self.stats["batch_ms_max"], 2),
+            queued=self.queue.qsize(),
+            queue_size=self.queue.maxsize,
+            pending_rows=len(self.pending),
+            stored_per_sec_10s=round(recent / 10, 1),
+            stored_per_sec_avg=round(self.stats["stored"] / max(now - self.started, 1e-6), 1),
+        )
+
+
+def ack_values(data):
+    """
+    A command ACK as the CommandLog values to update ({cmd_id, status, result}).
+    Raises KeyError/ValueError on an ACK without a cmd_id.
+    """
+    cmd_id = data["cmd_id"]
+    if not cmd_id or not isinstance(cmd_id, (str, int)):
+        raise ValueError(f"bad cmd_id {cmd_id!r}")
+    outcome = str(data.get("outcome") or "ack")
+    result = data.get("result", "")
+    return {
+        "cmd_id": str(cmd_id),
+        "status": "ACK" if outcome == "ack" else outcome.upper(),
+        "result": result if isinstance(result, str) else codec.dumps_str(result),
+    }
+
+
+def summary_rows(edge_id, topic, data):
+    """
+    An edge window summary (summary/<w>s/<topic>) as one TelemetrySummary row
+    per field. Raises KeyError/TypeError/ValueError on a malformed summary.
+    """
+    src_topic = topic.split("/", 2)[2] if topic.count("/") >= 2 else topic
+    start = datetime.datetime.utcfromtimestamp(float(data["start"]))
+    end = datetime.datetime.utcfromtimestamp(float(data["end"]))
+    window = int(data["window"])
+    fields = data.get("fields", {})
+    if not isinstance(fields, dict):
+        raise TypeError("fields must be an object")
+    return [
+        {"edge_id": edge_id, "topic": src_topic, "field": field, "window_sec": window,
+         "count": int(stats["count"]), "min": _num(stats["min"]), "max": _num(stats["max"]),
+         "mean": _num(stats["mean"]), "p95": _num(stats["p95"]), "ts_start": start, "ts_end": end}
+        for field, stats in fields.items()
+    ]
+
+
+def _num(value):
+    return None if value is None else float(value)
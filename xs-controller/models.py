@@ -23,3 +23,17 @@ class Telemetry(SQLModel, table=True):
             return json.loads(self.data)
         except Exception:
             return {}
+
+class TelemetrySummary(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    edge_id: str = Field(index=True)
+    topic: str = Field(index=True)
+    field: str
+    window_sec: int
+    count: int
+    min: float | None = None
+    max: float | None = None
+    mean: float | None = None
+    p95: float | None = None
+    ts_start: datetime.datetime
+    ts_end: datetime.datetime
@@ -2,7 +2,8 @@ from fastapi import APIRouter, HTTPException
 from aiomqtt import Client
 from sqlmodel import Session
 from models_ext import CommandLog, engine
-import json, logging, uuid, datetime
+import logging, uuid, datetime
+from utils import codec
 
 router = APIRouter()
 log = logging.getLogger("Commands")
@@ -32,9 +33,60 @@ async def send_command(payload: dict):
 
     try:
         async with Client("broker.hivemq.com", 8000, transport="websockets", websocket_path="/mqtt") as client:
-            await client.publish(f"xsctrl/commands/{edge_id}", json.dumps(msg).encode())
+            await client.publish(f"xsctrl/commands/{edge_id}", codec.dumps(msg))
             log.info(f"[CMD] Sent to {edge_id}: {msg}")
     except Exception as e:
         raise HTTPException(500, str(e))
 
     return {"cmd_id": cmd_id, "status": "sent"}
+
+@router.post("/batch")
+async def send_batch(payload: dict):
+    """
+    Send several actions to one Edge as a single command.
+    {
+        "edge_id": "xsedge-001",
+        "mode": "sequential",            # or "parallel"
+        "stop_on_error": true,           # sequential only
+        "timeout": 120,                  # optional, whole batch (s)
+        "steps": [ {"action": "...", "params": {...}}, ... ]
+    }
+    The Edge answers with one aggregated ACK carrying per-step results.
+    """
+    edge_id = payload.get("edge_id")
+    steps = payload.get("steps")
+    if not edge_id or not steps:
+        raise HTTPException(400, "Missing edge_id or steps")
+    if any(not isinstance(st, dict) or not st.get("action") for st in steps):
+        raise HTTPException(400, "Every step needs an action")
+    mode = payload.get("mode", "sequential")
+    if mode not in ("sequential", "parallel"):
+        raise HTTPException(400, "mode must be 'sequential' or 'parallel'")
+
+    cmd_id = str(uuid.uuid4())
+    msg = {
+        "cmd_id": cmd_id,
+        "edge_id": edge_id,
+        "type": "batch",
+        "action": "batch",
+        "mode": mode,
+        "stop_on_error": payload.get("stop_on_error", True),
+        "steps": [{"action": st["action"], "params": st.get("params", {})} for st in steps],
+        "timestamp": datetime.datetime.utcnow().isoformat(),
+    }
+    if payload.get("timeout"):
+        msg["timeout"] = payload["timeout"]
+
+    # One log row for the whole batch
+    with Session(engine) as s:
+        s.add(CommandLog(cmd_id=cmd_id, edge_id=edge_id, command=msg))
+        s.commit()
+
+    try:
+        async with Client("broker.hivemq.com", 8000, transport="websockets", websocket_path="/mqtt") as client:
+            await client.publish(f"xsctrl/commands/{edge_id}", codec.dumps(msg), qos=1)
+            log.info(f"[CMD] Sent batch of {len(steps)} steps to {edge_id} ({mode})")
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
+    return {"cmd_id": cmd_id, "status": "sent", "steps": len(steps)}
@@ -3,6 +3,7 @@ from fastapi import APIRouter, HTTPException, Request
 from mqtt_server import MQTTServer
 from aiomqtt import Client
 from dotenv import load_dotenv
+from utils import codec
 
 load_dotenv()
 log = logging.getLogger("Rules")
@@ -58,14 +59,14 @@ async def push_rules(request: Request):
             # individual edge pushes
             for eid in target_edges:
                 topic = f"xsctrl/rules/{eid}"
-                await client.publish(topic, json.dumps(rules).encode())
+                await client.publish(topic, codec.dumps(rules))
                 published.append(topic)
                 log.info(f"[Rules] Published {len(rules)} rules to {topic}")
 
             # broadcast (if requested)
             if broadcast:
                 topic = "xsctrl/rules/all"
-                await client.publish(topic, json.dumps(rules).encode())
+                await client.publish(topic, codec.dumps(rules))
                 published.append(topic)
                 log.info(f"[Rules] Broadcasted {len(rules)} rules to all edges")
 
@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 from sqlmodel import Session, select
-from models import Telemetry, engine
+from models import Telemetry, TelemetrySummary, engine
 
 router = APIRouter()
 
@@ -10,3 +10,15 @@ async def latest(limit:int=20):
         q = select(Telemetry).order_by(Telemetry.id.desc()).limit(limit)
         rows = s.exec(q).all()
         return [{"edge_id":r.edge_id,"topic":r.topic,"data":r.json_data(),"ts":r.ts} for r in rows]
+
+@router.get("/summary")
+async def summary(edge_id:str|None=None, topic:str|None=None, window:int|None=None, limit:int=100):
+    with Session(engine) as s:
+        q = select(TelemetrySummary).order_by(TelemetrySummary.id.desc()).limit(limit)
+        if edge_id:
+            q = q.where(TelemetrySummary.edge_id == edge_id)
+        if topic:
+            q = q.where(TelemetrySummary.topic == topic)
+        if window:
+            q = q.where(TelemetrySummary.window_sec == window)
+        return s.exec(q).all()
@@ -0,0 +1,43 @@
+import json, os
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the stdlib
+    orjson = None
+
+# ───────────────────────────────────────────────────────────────
+# Serialization used on the message path (MQTT ingest, command and rule
+# pushes, WebSocket broadcast, edge frames). JSON_CODEC=auto picks orjson
+# when it is installed; JSON_CODEC=json forces the stdlib. Output is
+# compact JSON either way, and anything not natively serializable is
+# written as str(). Binary edge frames use msgpack directly (see frames.py).
+# ───────────────────────────────────────────────────────────────
+JSON_CODEC = os.getenv("JSON_CODEC", "auto").lower()
+
+if orjson is not None and JSON_CODEC in ("auto", "orjson"):
+    JSON_BACKEND = "orjson"
+    _OPTS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        """Serialize to JSON bytes."""
+        try:
+            return orjson.dumps(obj, default=str, option=_OPTS)
+        except TypeError:   # e.g. ints beyond 64 bit
+            return json.dumps(obj, separators=(",", ":"), default=str).encode()
+
+    loads = orjson.loads
+else:
+    JSON_BACKEND = "json"
+
+    def dumps(obj):
+        """Serialize to JSON bytes."""
+        return json.dumps(obj, separators=(",", ":"), default=str).encode()
+
+    def loads(data):
+        return json.loads(data)
+
+
+def dumps_str(obj):
+    """Serialize to a JSON str (WebSocket text frames, SSE, NDJSON)."""
+    return dumps(obj).decode()
+
@@ -0,0 +1,76 @@
+import zlib
+from utils import codec as json_codec
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BATCH_TOPIC = "_batch"
+CONTENT_TYPE = "application/x-xs-batch"
+
+
+def decode_frame(payload: bytes) -> dict:
+    """
+    Decode an edge uplink batch frame.
+
+    Wire format:  b"<content-type>\\n" + compressed body, e.g.
+    ``application/x-xs-batch+msgpack;enc=zlib``. The body decodes to
+    {"edge_id": ..., "messages": [[topic, ts, data], ...]}.
+    """
+    header, _, body = payload.partition(b"\n")
+    ctype, _, params = header.decode().partition(";")
+    if not ctype.startswith(CONTENT_TYPE + "+"):
+        raise ValueError(f"Unsupported frame content type: {ctype}")
+    codec = ctype.split("+", 1)[1]
+    enc = dict(p.split("=", 1) for p in params.split(";") if "=" in p).get("enc", "none")
+
+    if enc == "zlib":
+        body = zlib.decompress(body)
+    elif enc == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd frame received but zstandard is not installed")
+        body = zstandard.ZstdDecompressor().decompress(body)
+    elif enc != "none":
+        raise ValueError(f"Unsupported frame encoding: {enc}")
+
+    if codec == "msgpack":
+        if msgpack is None:
+            raise ValueError("msgpack frame received but msgpack is not installed")
+        return msgpack.unpackb(body, raw=False)
+    if codec == "json":
+        return json_codec.loads(body)
+    raise ValueError(f"Unsupported frame codec: {codec}")
+
+
+class DeltaDecoder:
+    """
+    Rebuilds full telemetry values from edge delta-encoded uplink messages.
+
+    Edges using the `delta` uplink policy send a full keyframe followed by
+    {"_delta": {field: diff}, "_set": {field: value}} messages. The last full
+    value is kept per (edge_id, topic); deltas without a base are dropped.
+    """
+
+    def __init__(self):
+        self.last = {}
+
+    def apply(self, edge_id, topic, data):
+        key = (edge_id, topic)
+        if not isinstance(data, dict) or "_delta" not in data:
+            self.last[key] = data
+            return data
+        base = self.last.get(key)
+        if not isinstance(base, dict):
+            return None
+        full = dict(base)
+        for k, diff in data["_delta"].items():
+            full[k] = full.get(k, 0) + diff
+        full.update(data.get("_set", {}))
+        self.last[key] = full
+        return full
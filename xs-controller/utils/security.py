@@ -1,19 +1,29 @@
 import jwt, time, os, logging
+from utils.token_cache import TokenCache
 log = logging.getLogger("Security")
 
 class SecureAgent:
     def __init__(self):
         self.master_key = os.getenv("CTRL_MASTER_KEY", "CtrlMasterKey")
         self.secret = os.getenv("CTRL_JWT_SECRET", "ControllerSecret")
+        self.token_cache = TokenCache(
+            size=int(os.getenv("TOKEN_CACHE_SIZE", 1024)),
+            negative_ttl=float(os.getenv("TOKEN_NEGATIVE_TTL", 5)),
+        )
 
     def issue_token(self):
         payload = {"iat": time.time(), "exp": time.time() + 3600}
         return jwt.encode(payload, self.secret, algorithm="HS256")
 
     def verify_token(self, token):
+        cached = self.token_cache.get(token)
+        if cached is not None:
+            return cached
         try:
-            jwt.decode(token, self.secret, algorithms=["HS256"])
+            claims = jwt.decode(token, self.secret, algorithms=["HS256"])
+            self.token_cache.put(token, True, claims.get("exp"))
             return True
         except Exception as e:
-            log.error(e)
+            self.token_cache.put(token, False)
+            self.token_cache.failure(e)
             return False
@@ -0,0 +1,80 @@
+import collections, hashlib, logging, threading, time
+
+log = logging.getLogger("Security")
+
+
+class TokenCache:
+    """
+    Bounded LRU of JWT verification results, keyed by SHA-256 of the token
+    (raw tokens are never kept).
+
+    A valid token is cached until its `exp` (capped at max_ttl); a rejected
+    one for negative_ttl seconds, so a client retrying a bad token does not
+    cost a full decode per request. Failure logging is rate-limited to one
+    line per log_interval with a count of what was suppressed.
+    """
+
+    def __init__(self, size=1024, negative_ttl=5, max_ttl=300, log_interval=10):
+        self.size = size
+        self.negative_ttl = negative_ttl
+        self.max_ttl = max_ttl
+        self.log_interval = log_interval
+        self._entries = collections.OrderedDict()   # digest → (valid, expires_at)
+        self._lock = threading.Lock()               # API threads share one cache
+        self._last_log = 0.0
+        self._suppressed = 0
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0, "evictions": 0, "failures": 0}
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        """Cached result for `token`: True / False, or None when it must be verified."""
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits" if entry[0] else "negative_hits"] += 1
+            return entry[0]
+
+    def put(self, token, valid, exp=None):
+        now = time.time()
+        if valid:
+            expires = now + self.max_ttl
+            if exp is not None:
+                expires = min(expires, float(exp))
+        else:
+            expires = now + self.negative_ttl
+        if expires <= now:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (valid, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def failure(self, error):
+        """Log a rejected token, at most once per log_interval."""
+        self.stats["failures"] += 1
+        now = time.monotonic()
+        if now - self._last_log < self.log_interval:
+            self._suppressed += 1
+            return
+        more = f" (+{self._suppressed} more in the last {self.log_interval}s)" if self._suppressed else ""
+        log.warning(f"Token rejected: {error}{more}")
+        self._last_log, self._suppressed = now, 0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        return dict(self.stats, size=len(self._entries), capacity=self.size)
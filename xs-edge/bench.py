@@ -0,0 +1,110 @@
+"""
+Serialization and event-loop micro-benchmarks for the edge message path.
+
+    python bench.py [messages]
+
+Compares stdlib json with orjson on a typical bus payload (the JSON_CODEC
+choice), and DataBus publish → subscriber throughput on the default asyncio
+loop and on uvloop (the EVENT_LOOP choice). Backends that are not installed
+are skipped.
+"""
+import asyncio, json, sys, time
+from edgeos_core.data_bus import DataBus
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+MESSAGE = {
+    "edge_id": "xsedge-1234",
+    "topic": "network/metrics",
+    "data": {"network_latency": 73.4, "jitter_ms": 4.1, "loss_pct": 0.0, "link": "LTE",
+             "rssi": -71, "ts": 1760000000.123, "ok": True, "hops": [1, 2, 3]},
+}
+
+
+def rate(label, n, fn):
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<28} {n / elapsed:>12,.0f} /s   {elapsed / n * 1e6:6.2f} µs")
+    return elapsed
+
+
+def bench_codecs():
+    print(f"Codec ({N:,} messages)")
+    encoded = json.dumps(MESSAGE).encode()
+    rate("json.dumps", N, lambda: [json.dumps(MESSAGE, separators=(",", ":"), default=str).encode() for _ in range(N)])
+    rate("json.loads", N, lambda: [json.loads(encoded) for _ in range(N)])
+    if orjson is None:
+        print("  orjson not installed — skipped")
+        return
+    rate("orjson.dumps", N, lambda: [orjson.dumps(MESSAGE, default=str) for _ in range(N)])
+    rate("orjson.loads", N, lambda: [orjson.loads(encoded) for _ in range(N)])
+
+
+async def pump(n):
+    bus = DataBus(enable_persistence=False)
+    q = bus.subscribe("bench/topic")
+
+    async def consume():
+        for _ in range(n):
+            await q.get()
+
+    consumer = asyncio.create_task(consume())
+    for i in range(n):
+        await bus.publish("bench/topic", MESSAGE["data"])
+        if i % 1000 == 0:
+            await asyncio.sleep(0)
+    await consumer
+
+
+async def echo(n):
+    """Socket round trips on localhost — the I/O side of the loop (API, MQTT)."""
+    done = asyncio.Event()
+
+    async def handle(reader, writer):
+        while line := await reader.readline():
+            writer.write(line)
+        writer.close()
+        done.set()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    line = json.dumps(MESSAGE).encode() + b"\n"
+    for _ in range(n):
+        writer.write(line)
+        await reader.readline()
+    writer.close()
+    await done.wait()
+    server.close()
+    await server.wait_closed()
+
+
+def bench_loops():
+    factories = [("asyncio", asyncio.new_event_loop)]
+    if uvloop is not None:
+        factories.append(("uvloop", uvloop.new_event_loop))
+    for title, bench, n in (("DataBus publish → consume", pump, N), ("TCP echo round trips", echo, N // 5)):
+        print(f"\n{title} ({n:,} messages)")
+        for name, factory in factories:
+            with asyncio.Runner(loop_factory=factory) as runner:
+                rate(name, n, lambda: runner.run(bench(n)))
+    if uvloop is None:
+        print("\n  uvloop not installed — skipped")
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.INFO)
+    bench_codecs()
+    bench_loops()
@@ -1,8 +1,10 @@
-import asyncio, logging, os, threading, signal, sys, time
+import time
+_T0 = time.perf_counter()       # startup report counts module imports too
+import asyncio, importlib, logging, os, signal, sys
 from dotenv import load_dotenv
-from edgeos_core import data_bus, plugin_manager, rules_engine, local_db, secure_agent, web_api, mqtt_bridge
-from edgeos_core.command_handler import CommandHandler 
-import uvicorn
+from edgeos_core import data_bus, plugin_manager, rules_engine, local_db, secure_agent, lanes, scheduler, profiler, healer, startup, codec
+# MQTT (aiomqtt, msgpack) is imported only when enabled, FastAPI / uvicorn in a
+# thread while the rest of the runtime starts — see init_services()
 
 # ───────────────────────────────────────────────────────────────
 # SETUP
@@ -15,49 +17,125 @@ logging.getLogger("PluginManager").setLevel(logging.INFO)
 
 if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+elif os.getenv("EVENT_LOOP", "asyncio").lower() == "uvloop":
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        log.warning("EVENT_LOOP=uvloop but uvloop is not installed — using asyncio")
 # ───────────────────────────────────────────────────────────────
 # INIT SERVICES
 # ───────────────────────────────────────────────────────────────
-async def init_services():
+def build_bridge(bus, rules, scheduling, weights):
+    """Create the MQTT bridge and its command handler (imports the MQTT stack)."""
+    from edgeos_core import mqtt_bridge, uplink_policy
+    from edgeos_core.command_handler import CommandHandler
+
+    bridge = mqtt_bridge.MQTTBridge(
+        broker=os.getenv("MQTT_BROKER", "broker.hivemq.com"),
+        port=int(os.getenv("MQTT_PORT", 8000)),
+        edge_id=os.getenv("EDGE_ID", None),
+        rules_engine=rules,     # ✅ now properly defined
+        bus=bus,
+        batch_ms=int(os.getenv("MQTT_BATCH_MS", 0)),
+        batch_bytes=int(os.getenv("MQTT_BATCH_BYTES", 16384)),
+        batch_codec=os.getenv("MQTT_BATCH_CODEC", "msgpack"),
+        batch_compression=os.getenv("MQTT_BATCH_COMPRESSION", "zlib"),
+        policies=uplink_policy.UplinkPolicies.load(os.getenv("UPLINK_POLICY_PATH", "config/uplink.yaml")),
+        qos={
+            "telemetry": int(os.getenv("MQTT_QOS_TELEMETRY", 0)),
+            "ack": int(os.getenv("MQTT_QOS_ACK", 1)),
+            "alert": int(os.getenv("MQTT_QOS_ALERT", 1)),
+        },
+        inflight=int(os.getenv("MQTT_INFLIGHT", 32)),
+        queue_size=int(os.getenv("MQTT_UPLINK_QUEUE", 1000)),
+        max_retries=int(os.getenv("MQTT_MAX_RETRIES", 5)),
+        scheduling=scheduling,
+        weights=weights,
+    )
+
+    # ✅ create handler after rules exist
+    bridge.command_handler = CommandHandler(
+        rules,
+        workers=int(os.getenv("CMD_WORKERS", 4)),
+        default_timeout=float(os.getenv("CMD_TIMEOUT", 30)),
+    )
+    return bridge
+
+
+async def start_bridge(bridge, bus, rules):
+    """Connect and register with the broker, then attach the bridge (and aggregator) to the bus."""
+    from edgeos_core import aggregator
+
+    await bridge.connect()
+    await bus.attach_mqtt_bridge(bridge)
+
+    # Optional windowed pre-aggregation in front of the bridge
+    agg = aggregator.WindowAggregator.load(bridge.publish, rules, os.getenv("UPLINK_POLICY_PATH", "config/uplink.yaml"))
+    if agg:
+        bus.attach_aggregator(agg)
+        agg.start()
+
+
+async def init_services(monitor=None, timer=None):
+    """
+    Bring the runtime up. Independent work overlaps: the API stack is
+    imported in a thread from the start, and the broker connection and the
+    plugin scan run concurrently. Each phase is timed in `timer`.
+    """
     log.info("🚀 Starting XS Edge runtime...")
-    db = local_db.DBManager(os.getenv("DB_PATH", "xsedge.db"))
-    bus = data_bus.DataBus(db)
+    log.info(f"Event loop: {type(asyncio.get_running_loop()).__module__}, JSON codec: {codec.JSON_BACKEND}")
+    timer = timer or startup.StartupTimer()
+    api_import = asyncio.create_task(
+        timer.timed("api_import", asyncio.to_thread(importlib.import_module, "edgeos_core.web_api")))
+
+    with timer.phase("db"):
+        db = await asyncio.to_thread(local_db.DBManager, os.getenv("DB_PATH", "xsedge.db"))
+    scheduling = os.getenv("BUS_SCHEDULING", "strict")
+    weights = lanes.parse_weights(os.getenv("BUS_LANE_WEIGHTS", "8,4,1"))
+    bus = data_bus.DataBus(db, scheduling=scheduling, weights=weights)
 
     # Create and load Rules Engine first ✅
-    rules = rules_engine.RulesEngine(db)
-    rules.load()
+    with timer.phase("rules"):
+        rules = rules_engine.RulesEngine(db)
+        rules.load()
+        startup.restore_snapshot(startup.SNAPSHOT_PATH, bus, rules)
 
     # Optional MQTT bridge setup
     bridge = None
     if os.getenv("MQTT_ENABLED", "false").lower() == "true":
-        bridge = mqtt_bridge.MQTTBridge(
-            broker=os.getenv("MQTT_BROKER", "broker.hivemq.com"),
-            port=int(os.getenv("MQTT_PORT", 8000)),
-            edge_id=os.getenv("EDGE_ID", None),
-            rules_engine=rules,     # ✅ now properly defined
-            bus=bus
-        )
-
-        # ✅ create handler after rules exist
-        bridge.command_handler = CommandHandler(rules)
-        await bridge.connect()
-        await bus.attach_mqtt_bridge(bridge)
+        with timer.phase("mqtt_setup"):
+            bridge = build_bridge(bus, rules, scheduling, weights)
 
     # Initialize security and plugin system
     sa = secure_agent.SecureAgent()
-    pm = plugin_manager.PluginManager(bus, db, rules, sa)
-    await pm.load_all()
+    sched = scheduler.Scheduler()
+    sched.start()
+    pm = plugin_manager.PluginManager(bus, db, rules, sa, scheduler=sched)
+
+    # Broker connect + registration and plugin loading don't depend on each other
+    await asyncio.gather(
+        timer.timed("plugins", pm.load_all()),
+        *([timer.timed("mqtt_connect", start_bridge(bridge, bus, rules))] if bridge else []),
+    )
+    if bridge:
+        pm.register_commands(bridge.command_handler)
+
+    # Graduated self-healing (plugin → MQTT → DB → re-exec)
+    heal = healer.Healer(pm, bus, db, bridge=bridge, monitor=monitor)
 
     # Create FastAPI app
-    app = web_api.create_app(pm, db, rules, sa, bus)
-    return app, pm, db, bridge
+    web_api = await api_import
+    with timer.phase("api_app"):
+        app = web_api.create_app(pm, db, rules, sa, bus, monitor=monitor, healer=heal, startup=timer)
+    return app, pm, db, bridge, heal
 
 
 # ───────────────────────────────────────────────────────────────
 # SHUTDOWN
 # ───────────────────────────────────────────────────────────────
-async def shutdown(pm, db):
-    """Gracefully stop plugins and close DB."""
+async def shutdown(pm, db, bridge=None):
+    """Gracefully stop plugins, flush the MQTT bridge and close DB."""
     log.info("🛑 Initiating graceful shutdown...")
 
     for name, plugin in pm.plugins.items():
@@ -67,6 +145,11 @@ async def shutdown(pm, db):
                 log.info(f"[{name}] stopped cleanly")
             except Exception as e:
                 log.error(f"[{name}] error on stop: {e}")
+    await pm.scheduler.stop()
+    startup.save_snapshot(startup.SNAPSHOT_PATH, pm.bus, pm.rules)
+
+    if bridge:
+        await bridge.disconnect()
 
     try:
         db.conn.close()
@@ -76,49 +159,23 @@ async def shutdown(pm, db):
 
     log.info("✅ XS Edge shutdown complete.")
 
-# ───────────────────────────────────────────────────────────────
-# WATCHDOG
-# ───────────────────────────────────────────────────────────────
-async def watchdog(pm, api_thread, stop_event):
-    """Monitor plugin health and restart system if needed."""
-    crash_log = {}
-    while not stop_event.is_set():
-        await asyncio.sleep(10)
-
-        # Check API thread
-        if not api_thread.is_alive():
-            log.error("💥 API thread stopped — restarting entire XS Edge...")
-            os.execv(sys.executable, [sys.executable] + sys.argv)
-
-        # Check plugin registry for stalled tasks
-        for name, plugin in pm.plugins.items():
-            last_hb = getattr(plugin, "last_heartbeat", None)
-            if last_hb and (time.time() - last_hb > 30):
-                log.warning(f"⚠️ Plugin {name} unresponsive (>30 s)")
-                crash_log.setdefault(name, []).append(time.time())
-
-                # Too many failures → restart entire Edge process
-                recent = [t for t in crash_log[name] if time.time() - t < 60]
-                if len(recent) >= 3:
-                    log.error(f"🔥 {name} failed 3× in 60 s → restarting XS Edge")
-                    os.execv(sys.executable, [sys.executable] + sys.argv)
-
 # ───────────────────────────────────────────────────────────────
 # MAIN
 # ───────────────────────────────────────────────────────────────
 async def main():
-    app, pm, db, bridge = await init_services()
+    # Loop lag monitor first, so a blocking startup step is reported too
+    monitor = profiler.LoopMonitor().start()
+    timer = startup.StartupTimer(_T0)
+    app, pm, db, bridge, heal = await init_services(monitor, timer)
+    from edgeos_core.web_api import serve_api
     port = int(os.getenv("API_PORT", 8000))
 
-    # Start FastAPI (Uvicorn) in background thread
-    def run_api():
-        uvicorn.run(app, host="0.0.0.0", port=port, log_level="info")
+    stop_event = asyncio.Event()
 
-    api_thread = threading.Thread(target=run_api, daemon=True)
-    api_thread.start()
+    # FastAPI (Uvicorn) as a task on the main loop
+    api_task = asyncio.create_task(serve_api(app, port, stop_event))
     log.info(f"🌐 XS Edge API running on http://0.0.0.0:{port}")
-
-    stop_event = asyncio.Event()
+    timer.done()
 
     # Signal handling (cross-platform)
     loop = asyncio.get_running_loop()
@@ -131,15 +188,16 @@ async def main():
             stop_event.set()
         signal.signal(signal.SIGINT, lambda s, f: win_exit())
 
-    # Launch watchdog task
-    asyncio.create_task(watchdog(pm, api_thread, stop_event))
+    # Launch self-healing watchdog
+    asyncio.create_task(heal.run(stop_event))
 
     # Keep loop alive
     try:
-        while not stop_event.is_set():
-            await asyncio.sleep(1)
+        await stop_event.wait()
+        await api_task
     finally:
-        await shutdown(pm, db)
+        monitor.stop()
+        await shutdown(pm, db, bridge)
 
 # ───────────────────────────────────────────────────────────────
 # ENTRY POINT
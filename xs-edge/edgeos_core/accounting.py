@@ -0,0 +1,119 @@
+import collections, logging, os, time, types
+
+log = logging.getLogger("Accounting")
+
+SLOW_CALLBACK_MS = float(os.getenv("PLUGIN_SLOW_CALLBACK_MS", 100))
+
+
+def coro_stack(coro, limit=12):
+    """Where a suspended coroutine is parked: its await chain as 'file:line in func' strings."""
+    stack = []
+    while coro is not None and len(stack) < limit:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        stack.append(f"{frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}")
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return stack
+
+
+class PluginStats:
+    """
+    Work attributed to one plugin.
+
+    A step is one resume of one of the plugin's coroutines (its on_start
+    task or a scheduler job) up to its next suspension — i.e. the time it
+    held the event loop. CPU is thread CPU time, so on the main loop it
+    excludes other threads. Steps longer than the slow threshold are kept
+    with the coroutine's await chain.
+    """
+
+    def __init__(self, name, slow_ms=None):
+        self.name = name
+        self.slow_ms = slow_ms or SLOW_CALLBACK_MS
+        self.started = time.time()
+        self.steps = 0
+        self.cpu_s = 0.0
+        self.wall_s = 0.0
+        self.max_step_ms = 0.0
+        self.iterations = 0
+        self.iteration_wall_s = 0.0
+        self.published = 0
+        self.consumed = 0
+        self.queues = []                        # LaneQueues whose `consumed` counts add up here
+        self.slow_count = 0
+        self.slow = collections.deque(maxlen=20)
+        self._last_warning = 0.0
+
+    def record_step(self, wall, cpu, coro):
+        self.steps += 1
+        self.wall_s += wall
+        self.cpu_s += cpu
+        ms = wall * 1000
+        if ms > self.max_step_ms:
+            self.max_step_ms = ms
+        if ms >= self.slow_ms:
+            self.slow_count += 1
+            stack = coro_stack(coro) or [getattr(coro, "__qualname__", repr(coro))]
+            self.slow.append({"ts": time.time(), "ms": round(ms, 1), "stack": stack})
+            now = time.monotonic()
+            if now - self._last_warning > 10:
+                self._last_warning = now
+                log.warning(f"[{self.name}] blocked the event loop for {ms:.0f} ms at {stack[-1]}")
+
+    def record_iteration(self, wall):
+        self.iterations += 1
+        self.iteration_wall_s += wall
+
+    def summary(self):
+        uptime = max(time.time() - self.started, 1e-6)
+        return {
+            "cpu_ms": round(self.cpu_s * 1000, 1),
+            "cpu_pct": round(100 * self.cpu_s / uptime, 2),
+            "wall_ms": round(self.wall_s * 1000, 1),
+            "steps": self.steps,
+            "max_step_ms": round(self.max_step_ms, 1),
+            "iterations": self.iterations,
+            "wall_ms_per_iteration": round(1000 * self.iteration_wall_s / self.iterations, 2) if self.iterations else None,
+            "published": self.published,
+            "consumed": self.consumed + sum(getattr(q, "consumed", 0) for q in self.queues),
+            "slow_callbacks": self.slow_count,
+        }
+
+    def to_dict(self):
+        return dict(self.summary(), slow_threshold_ms=self.slow_ms, recent_slow=list(self.slow))
+
+
+@types.coroutine
+def _accounted(coro, stats):
+    """Drive `coro` step by step, charging each step's wall and CPU time to `stats`."""
+    value, error = None, None
+    while True:
+        w0, c0 = time.perf_counter(), time.thread_time()
+        try:
+            yielded = coro.throw(error) if error is not None else coro.send(value)
+        except StopIteration as e:
+            stats.record_step(time.perf_counter() - w0, time.thread_time() - c0, coro)
+            return e.value
+        except BaseException:
+            stats.record_step(time.perf_counter() - w0, time.thread_time() - c0, coro)
+            raise
+        stats.record_step(time.perf_counter() - w0, time.thread_time() - c0, coro)
+        try:
+            value, error = (yield yielded), None
+        except GeneratorExit:
+            coro.close()
+            raise
+        except BaseException as e:
+            value, error = None, e
+
+
+async def run_accounted(awaitable, stats, iteration=False):
+    """Await `awaitable` with per-step accounting; with iteration=True the whole run counts as one iteration."""
+    coro = awaitable if hasattr(awaitable, "send") else awaitable.__await__()
+    started = time.perf_counter()
+    try:
+        return await _accounted(coro, stats)
+    finally:
+        if iteration:
+            stats.record_iteration(time.perf_counter() - started)
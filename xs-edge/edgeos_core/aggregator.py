@@ -0,0 +1,207 @@
+import asyncio, logging, os, time, yaml
+from edgeos_core.data_bus import topic_matches
+
+log = logging.getLogger("Aggregator")
+
+
+class P2Quantile:
+    """
+    Streaming quantile estimate (Jain & Chlamtac P² algorithm).
+    O(1) memory and time per sample — five markers, no sample buffer.
+    """
+
+    def __init__(self, p=0.95):
+        self.p = p
+        self.n = 0
+        self.q = []
+        self.pos = [1, 2, 3, 4, 5]
+        self.des = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.inc = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        if self.n < 5:
+            self.q.append(x)
+            self.n += 1
+            if self.n == 5:
+                self.q.sort()
+            return
+
+        self.n += 1
+        q, pos = self.q, self.pos
+        if x < q[0]:
+            q[0], k = x, 0
+        elif x >= q[4]:
+            q[4], k = x, 3
+        else:
+            k = next(i for i in range(4) if q[i] <= x < q[i + 1])
+        for i in range(k + 1, 5):
+            pos[i] += 1
+        for i in range(5):
+            self.des[i] += self.inc[i]
+
+        for i in (1, 2, 3):
+            d = self.des[i] - pos[i]
+            if (d >= 1 and pos[i + 1] - pos[i] > 1) or (d <= -1 and pos[i - 1] - pos[i] < -1):
+                d = 1 if d > 0 else -1
+                qn = self._parabolic(i, d)
+                if not q[i - 1] < qn < q[i + 1]:
+                    qn = q[i] + d * (q[i + d] - q[i]) / (pos[i + d] - pos[i])
+                q[i] = qn
+                pos[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self.q, self.pos
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self):
+        if self.n == 0:
+            return None
+        if self.n < 5:
+            s = sorted(self.q)
+            return s[min(int(round(self.p * (self.n - 1))), self.n - 1)]
+        return self.q[2]
+
+
+class FieldSummary:
+    """count / min / max / mean / p95 for one numeric field over one window."""
+
+    __slots__ = ("count", "min", "max", "sum", "p95")
+
+    def __init__(self):
+        self.count, self.min, self.max, self.sum = 0, None, None, 0.0
+        self.p95 = P2Quantile(0.95)
+
+    def add(self, x):
+        self.count += 1
+        self.sum += x
+        self.min = x if self.min is None or x < self.min else self.min
+        self.max = x if self.max is None or x > self.max else self.max
+        self.p95.add(x)
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "mean": round(self.sum / self.count, 4) if self.count else None,
+            "p95": self.p95.value(),
+        }
+
+
+class WindowAggregator:
+    """
+    Uplink pipeline stage between DataBus and MQTTBridge.
+
+    Numeric fields of matching topics are folded into tumbling windows
+    (default 10 s and 60 s). When a window closes, one summary per topic is
+    published through the bridge on `summary/<window>s/<topic>`.
+
+    Per topic, `raw` decides whether the original samples still go uplink:
+    `always`, `never`, or `on_alarm` (only while a rule has fired within the
+    last `alarm_hold` seconds).
+    """
+
+    def __init__(self, sink, rules=None, windows=(10, 60), topics=None, alarm_hold=30):
+        self.sink = sink                    # async publish(topic, data) — normally the MQTT bridge
+        self.rules = rules
+        self.windows = tuple(int(w) for w in windows)
+        self.topics = topics or []          # [{"topic": pattern, "raw": mode}, ...]
+        self.alarm_hold = alarm_hold
+        self.buckets = {w: {} for w in self.windows}   # window → topic → field → FieldSummary
+        self.window_start = {w: self._bucket_start(w, time.time()) for w in self.windows}
+        self._resolved = {}
+        self._task = None
+        self.stats = {"samples": 0, "summaries": 0, "raw_forwarded": 0, "raw_suppressed": 0}
+
+    @classmethod
+    def load(cls, sink, rules=None, path="config/uplink.yaml"):
+        """Build from the `aggregation:` section of the uplink config, or None if absent."""
+        if not os.path.exists(path):
+            return None
+        try:
+            cfg = (yaml.safe_load(open(path)) or {}).get("aggregation")
+            if not cfg:
+                return None
+            agg = cls(sink, rules, cfg.get("windows", (10, 60)), cfg.get("topics", []), cfg.get("alarm_hold", 30))
+            log.info(f"✅ Aggregating {len(agg.topics)} topic patterns over windows {agg.windows}")
+            return agg
+        except Exception as e:
+            log.error(f"❌ Failed to load aggregation config from {path}: {e}")
+            return None
+
+    @staticmethod
+    def _bucket_start(window, ts):
+        return ts - (ts % window)
+
+    def _config_for(self, topic):
+        if topic not in self._resolved:
+            self._resolved[topic] = next((t for t in self.topics if topic_matches(t["topic"], topic)), None)
+        return self._resolved[topic]
+
+    def _alarm_active(self):
+        last = getattr(self.rules, "last_triggered", 0) if self.rules else 0
+        return time.time() - last < self.alarm_hold
+
+    # ───────────────────────────────────────────────────────────────
+    def observe(self, topic, data):
+        """
+        Fold a bus message into the open windows.
+        Returns True if the raw message should still be forwarded uplink.
+        """
+        cfg = self._config_for(topic)
+        if cfg is None or not isinstance(data, dict):
+            return True
+
+        for k, v in data.items():
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                for w in self.windows:
+                    fields = self.buckets[w].setdefault(topic, {})
+                    summary = fields.get(k)
+                    if summary is None:
+                        summary = fields[k] = FieldSummary()
+                    summary.add(v)
+        self.stats["samples"] += 1
+
+        raw = cfg.get("raw", "never")
+        forward = raw == "always" or (raw == "on_alarm" and self._alarm_active())
+        self.stats["raw_forwarded" if forward else "raw_suppressed"] += 1
+        return forward
+
+    async def flush(self, now=None):
+        """Emit summaries for every window that has closed."""
+        now = now if now is not None else time.time()
+        for w in self.windows:
+            start = self.window_start[w]
+            if now < start + w:
+                continue
+            closed, self.buckets[w] = self.buckets[w], {}
+            self.window_start[w] = self._bucket_start(w, now)
+            for topic, fields in closed.items():
+                summary = {
+                    "window": w,
+                    "start": start,
+                    "end": start + w,
+                    "fields": {k: s.to_dict() for k, s in fields.items()},
+                }
+                try:
+                    await self.sink(f"summary/{w}s/{topic}", summary)
+                    self.stats["summaries"] += 1
+                except Exception as e:
+                    log.warning(f"[Aggregator] Summary publish failed for {topic}: {e}")
+
+    async def run(self, tick=1.0):
+        """Background loop closing windows on wall-clock boundaries."""
+        while True:
+            await asyncio.sleep(tick)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    def get_stats(self):
+        return dict(self.stats, windows=list(self.windows))
@@ -0,0 +1,74 @@
+import asyncio, collections, heapq
+from edgeos_core import codec
+from edgeos_core.data_bus import topic_matches
+
+
+class BusStream:
+    """
+    One live client's view of the DataBus (WebSocket / SSE).
+
+    Messages on topics matching any of `patterns` (MQTT wildcards) go into a
+    bounded per-client buffer; when a slow client lets it fill up, the oldest
+    messages are dropped and counted. batches() yields everything buffered
+    at most once per `interval` seconds, so a busy bus costs one frame per
+    tick instead of one per message. With `replay`, up to that many recent
+    messages per matching topic are sent first, oldest first.
+    """
+
+    def __init__(self, bus, patterns, buffer=1000, interval=0.25, replay=0):
+        self.bus = bus
+        self.patterns = patterns or ["#"]
+        self.interval = interval
+        self.replay = replay
+        self.buffer = collections.deque(maxlen=buffer)
+        self.dropped = 0
+        self.sent = 0
+        self._ready = asyncio.Event()
+
+    def open(self):
+        if self.replay:
+            history = [
+                [(ts, topic, data) for ts, data in list(entries)[-self.replay:]]
+                for topic, entries in self.bus.replay.items()
+                if any(topic_matches(p, topic) for p in self.patterns)
+            ]
+            for ts, topic, data in heapq.merge(*history, key=lambda m: m[0]):
+                self._push(topic, ts, data)
+        self.bus.taps.append(self._on_message)
+        return self
+
+    def close(self):
+        if self._on_message in self.bus.taps:
+            self.bus.taps.remove(self._on_message)
+
+    def _on_message(self, topic, ts, data):
+        for p in self.patterns:
+            if topic_matches(p, topic):
+                self._push(topic, ts, data)
+                return
+
+    def _push(self, topic, ts, data):
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append({"topic": topic, "ts": ts, "data": data})
+        self._ready.set()
+
+    async def batches(self):
+        """Yield JSON frames {"messages": [...], "dropped": n} as messages arrive, one per interval at most."""
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            messages = list(self.buffer)
+            self.buffer.clear()
+            self.sent += len(messages)
+            yield codec.dumps_str({"messages": messages, "dropped": self.dropped})
+            await asyncio.sleep(self.interval)
+
+    @classmethod
+    def from_params(cls, bus, topics=None, replay=0, interval_ms=250, buffer=1000):
+        """Build a stream from query parameters, clamped to sane ranges."""
+        patterns = [t.strip() for t in (topics or "#").split(",") if t.strip()]
+        return cls(bus, patterns,
+                   buffer=max(1, min(int(buffer), 10000)),
+                   interval=max(0.01, min(int(interval_ms), 10000)) / 1000,
+                   replay=max(0, min(int(replay), bus.replay_limit)))
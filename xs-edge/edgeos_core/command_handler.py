@@ -1,33 +1,224 @@
-import json, logging, asyncio, os
+import json, logging, asyncio, contextlib, os, time, collections
 from pathlib import Path
+from edgeos_core import codec
+from edgeos_core.lanes import CONTROL
 
 log = logging.getLogger("CommandHandler")
 
 class CommandHandler:
-    def __init__(self, rules):
+    """
+    Executes controller commands off the MQTT receive loop.
+
+    Commands are parsed and de-duplicated by `cmd_id` (LRU), then queued for a
+    bounded pool of workers. Each action is a registered async handler with
+    its own concurrency limit and timeout. Progress is published on
+    `progress/{cmd_id}` and the result on `ack/{cmd_id}`, both on the control lane.
+    """
+
+    def __init__(self, rules, workers=4, queue_size=256, dedup_size=1024, default_timeout=30):
         self.rules = rules
+        self.handlers = {}                          # action → {"fn", "sem", "timeout"}
+        self.num_workers = workers
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dedup_size = dedup_size
+        self.seen = collections.OrderedDict()       # cmd_id → ack dict (None while running)
+        self.default_timeout = default_timeout
+        self.workers = []
+        self.stats = {"received": 0, "duplicates": 0, "rejected": 0, "completed": 0,
+                      "failed": 0, "timeouts": 0, "running": 0}
+
+        self.register("reload_rules", self._reload_rules, concurrency=1, timeout=10)
+        self.register("ping", self._ping)
+        self.register("batch", self._batch, timeout=default_timeout * 10)
+
+    # ───────────────────────────────────────────────
+    def register(self, action, fn, concurrency=None, timeout=None):
+        """
+        Register `async fn(cmd, progress)` for an action.
+        `progress(message, pct=None)` publishes an intermediate update.
+        A dict result carrying an "outcome" key overrides the default "ack" outcome.
+        """
+        self.handlers[action] = {
+            "fn": fn,
+            "sem": asyncio.Semaphore(concurrency) if concurrency else None,
+            "timeout": timeout or self.default_timeout,
+        }
 
+    def start(self):
+        """Spawn the worker pool (idempotent)."""
+        if not self.workers:
+            self.workers = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+            log.info(f"[CMD] Started {self.num_workers} command workers")
+
+    async def stop(self):
+        for w in self.workers:
+            w.cancel()
+        self.workers = []
+
+    # ───────────────────────────────────────────────
     async def handle_command(self, payload, bus):
-        cmd = json.loads(payload)
+        """Parse, de-duplicate and queue a command. Returns without waiting for execution."""
+        self.start()
+        cmd = codec.loads(payload)
+        cmd_id = cmd.get("cmd_id")
+        self.stats["received"] += 1
+
+        # Only commands that carry an id can be de-duplicated
+        if cmd_id and cmd_id in self.seen:
+            self.stats["duplicates"] += 1
+            self.seen.move_to_end(cmd_id)
+            ack = self.seen[cmd_id]
+            if ack is not None:
+                # already executed — resend the ACK in case the first one was lost
+                await bus.publish(f"ack/{cmd_id}", ack, CONTROL)
+            log.info(f"[CMD] Duplicate {cmd_id} ignored")
+            return
+
+        try:
+            self.queue.put_nowait((cmd, bus))
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            await bus.publish(f"ack/{cmd_id}", self._ack(cmd, "rejected", "Edge busy: command queue full"), CONTROL)
+            log.warning(f"[CMD] Queue full, rejected {cmd_id}")
+            return
+
+        if not cmd_id:
+            return
+        self.seen[cmd_id] = None
+        while len(self.seen) > self.dedup_size:
+            self.seen.popitem(last=False)
+
+    async def _worker(self):
+        while True:
+            cmd, bus = await self.queue.get()
+            try:
+                await self.execute(cmd, bus)
+            except Exception as e:
+                log.error(f"[CMD] Worker error: {e}")
+            finally:
+                self.queue.task_done()
+
+    # ───────────────────────────────────────────────
+    async def execute(self, cmd, bus):
+        """Run one command through its handler and publish the ACK. Returns the ACK."""
         cmd_id = cmd.get("cmd_id")
-        edge_id = cmd.get("edge_id")
         action = cmd.get("action")
 
-        result = "unknown"
+        async def progress(message, pct=None):
+            await bus.publish(f"progress/{cmd_id}", {
+                "cmd_id": cmd_id, "edge_id": cmd.get("edge_id"),
+                "status": "running", "message": message, "pct": pct,
+            }, CONTROL)
+
+        status, result, duration_ms = await self._run(cmd, progress)
+        ack = self._ack(cmd, status, result, duration_ms)
+        if cmd_id in self.seen:
+            self.seen[cmd_id] = ack
+        await bus.publish(f"ack/{cmd_id}", ack, CONTROL)
+        log.info(f"[CMD] {cmd.get('edge_id')} executed '{action}' → {status}")
+        return ack
+
+    async def _run(self, cmd, progress):
+        """Execute a command's handler under its concurrency limit and timeout → (outcome, result, ms)."""
+        action = cmd.get("action")
+        handler = self.handlers.get(action)
+        timeout = cmd.get("timeout") or (handler["timeout"] if handler else None)
+        started = time.perf_counter()
+        admitted = False
+
+        self.stats["running"] += 1
         try:
-            if action == "reload_rules":
-                # overwrite rules file if provided
-                rules = cmd.get("rules")
-                if rules:
-                    rules_path = Path("config/rules_demo.json")
-                    rules_path.write_text(json.dumps(rules, indent=2))
-                self.rules.load()
-                result = "Rules reloaded"
+            if handler is None:
+                # ACK "status" stays "ack" for old controllers; the outcome says it never ran
+                status, result = "rejected", f"Unhandled action: {action}"
+                self.stats["rejected"] += 1
             else:
-                result = f"Unhandled action: {action}"
+                # The timeout covers waiting for a concurrency slot as well as the run itself
+                async with asyncio.timeout(timeout):
+                    async with handler["sem"] or contextlib.nullcontext():
+                        admitted = True
+                        result = await handler["fn"](cmd, progress)
+                status = result.get("outcome", "ack") if isinstance(result, dict) else "ack"
+                self.stats["completed"] += 1
+        except asyncio.TimeoutError:
+            waiting = "" if admitted else f" waiting for a free '{action}' slot"
+            status, result = "timeout", f"Timeout after {timeout}s{waiting}"
+            self.stats["timeouts"] += 1
         except Exception as e:
-            result = f"Error: {e}"
+            status, result = "error", f"Error: {e}"
+            self.stats["failed"] += 1
+        finally:
+            self.stats["running"] -= 1
+
+        return status, result, round((time.perf_counter() - started) * 1000, 1)
+
+    @staticmethod
+    def _ack(cmd, status, result, duration_ms=None):
+        return {
+            "cmd_id": cmd.get("cmd_id"), "edge_id": cmd.get("edge_id"), "action": cmd.get("action"),
+            "status": "ack", "outcome": status, "result": result, "duration_ms": duration_ms,
+        }
+
+    def get_stats(self):
+        return dict(self.stats, queued=self.queue.qsize(), actions=sorted(self.handlers))
+
+    # ───────────────────────────────────────────────
+    # Built-in actions
+    # ───────────────────────────────────────────────
+    async def _reload_rules(self, cmd, progress):
+        # overwrite rules file if provided
+        rules = cmd.get("rules") or cmd.get("params", {}).get("rules")
+        if rules:
+            rules_path = Path("config/rules_demo.json")
+            await asyncio.to_thread(rules_path.write_text, json.dumps(rules, indent=2))
+            await progress("Rules file written")
+        await asyncio.to_thread(self.rules.load)
+        return "Rules reloaded"
+
+    async def _ping(self, cmd, progress):
+        return "pong"
+
+    async def _batch(self, cmd, progress):
+        """
+        Run cmd["steps"] (each {"action": ..., "params": {...}}) in one round trip.
+        mode "sequential" runs in order and, with stop_on_error, skips the rest
+        after a failure; mode "parallel" runs all steps concurrently.
+        """
+        steps = cmd.get("steps", [])
+        mode = cmd.get("mode", "sequential")
+        stop_on_error = cmd.get("stop_on_error", True)
+
+        def sub_cmd(i, step):
+            return {**step, "cmd_id": f"{cmd.get('cmd_id')}.{i}", "edge_id": cmd.get("edge_id"),
+                    "params": step.get("params", {})}
+
+        async def run_step(i, step):
+            outcome, result, ms = await self._run(sub_cmd(i, step), progress)
+            return {"index": i, "action": step.get("action"), "outcome": outcome,
+                    "result": result, "duration_ms": ms}
+
+        if mode == "parallel":
+            results = list(await asyncio.gather(*(run_step(i, st) for i, st in enumerate(steps))))
+        else:
+            results, failed = [], False
+            for i, step in enumerate(steps):
+                if failed and stop_on_error:
+                    results.append({"index": i, "action": step.get("action"), "outcome": "skipped",
+                                    "result": None, "duration_ms": 0})
+                    continue
+                res = await run_step(i, step)
+                results.append(res)
+                failed = failed or res["outcome"] != "ack"
+                await progress(f"step {i + 1}/{len(steps)} {res['action']} → {res['outcome']}",
+                               round(100 * (i + 1) / len(steps)))
 
-        ack = {"cmd_id": cmd_id, "edge_id": edge_id, "status": "ack", "result": result}
-        await bus.publish(f"ack/{cmd_id}", ack)
-        log.info(f"[CMD] {edge_id} executed '{action}' → {result}")
+        ok = sum(1 for r in results if r["outcome"] == "ack")
+        skipped = sum(1 for r in results if r["outcome"] == "skipped")
+        return {
+            "outcome": "ack" if ok == len(results) else "partial",
+            "mode": mode,
+            "ok": ok,
+            "failed": len(results) - ok - skipped,
+            "skipped": skipped,
+            "steps": results,
+        }
@@ -1,33 +1,71 @@
 import asyncio, logging, collections, time
+from edgeos_core.lanes import LaneQueue, priority_for, CONTROL, DEFAULT_WEIGHTS
 
 log = logging.getLogger("DataBus")
 
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    """
+    MQTT-style topic match: `+` matches one level, `#` matches the rest.
+    """
+    if pattern == topic or pattern == "#":
+        return True
+    p_parts, t_parts = pattern.split("/"), topic.split("/")
+    for i, p in enumerate(p_parts):
+        if p == "#":
+            return True
+        if i >= len(t_parts) or (p != "+" and p != t_parts[i]):
+            return False
+    return len(p_parts) == len(t_parts)
+
 class DataBus:
     """
     Async in-memory message bus with optional persistence and replay buffer.
     Supports publish/subscribe for inter-plugin comms and hooks for controller bridging.
     """
 
-    def __init__(self, db=None, replay_limit=50, enable_persistence=True):
-        self.subscribers = {}           # topic → [asyncio.Queue, ...]
+    def __init__(self, db=None, replay_limit=50, enable_persistence=True, scheduling="strict", weights=DEFAULT_WEIGHTS):
+        self.subscribers = {}           # topic → [LaneQueue, ...]
         self.replay = {}                # topic → deque of (timestamp, data)
         self.stats = collections.defaultdict(lambda: {"published": 0, "subscribers": 0})
         self.db = db
         self.replay_limit = replay_limit
         self.enable_persistence = enable_persistence
         self.bridge = None              # placeholder for future MQTT/WebSocket bridge
+        self.aggregator = None          # optional pre-uplink windowed aggregation stage
+        self.scheduling = scheduling    # lane scheduling for subscriber queues: strict | weighted
+        self.weights = weights
+        self.subscribe_hooks = []       # callables(topic) run on every subscribe (e.g. lazy plugin loading)
+        self.taps = []                  # callables(topic, ts, data) seeing every message (live API streams)
 
     # ───────────────────────────────────────────────────────────────
-    async def publish(self, topic: str, data: dict):
+    async def publish(self, topic: str, data: dict, priority: int = None):
         """
         Publish an event to all subscribers and update replay buffer.
+        `priority` (control > alert > telemetry) defaults from the topic; control
+        traffic is handed to subscribers and the bridge before it is persisted.
         """
+        if priority is None:
+            priority = priority_for(topic)
         ts = time.time()
         if topic not in self.replay:
             self.replay[topic] = collections.deque(maxlen=self.replay_limit)
         self.replay[topic].append((ts, data))
         self.stats[topic]["published"] += 1
+        for tap in self.taps:
+            try:
+                tap(topic, ts, data)
+            except Exception as e:
+                log.error(f"[Bus] Tap error for {topic}: {e}")
 
+        if priority == CONTROL:
+            await self._fan_out(topic, data, priority)
+            self._persist(topic, data)
+        else:
+            self._persist(topic, data)
+            await self._fan_out(topic, data, priority)
+
+    def _persist(self, topic, data):
         # persist to DB (optional)
         if self.db and self.enable_persistence:
             try:
@@ -35,16 +73,19 @@ class DataBus:
             except Exception as e:
                 log.error(f"[Bus] DB insert error for {topic}: {e}")
 
+    async def _fan_out(self, topic, data, priority):
         # publish to local subscribers
         if topic in self.subscribers:
             for q in self.subscribers[topic]:
-                await q.put(data)
+                q.put_nowait((priority, data))
             log.debug(f"[Bus] Published {topic} → {len(self.subscribers[topic])} subs")
 
-        # optional bridge
+        # optional bridge (raw samples may be replaced by window summaries)
         if self.bridge:
+            if self.aggregator and not self.aggregator.observe(topic, data):
+                return
             try:
-                await self.bridge.publish(topic, data)
+                await self.bridge.publish(topic, data, priority)
             except Exception as e:
                 log.warning(f"[Bus] Bridge publish failed for {topic}: {e}")
 
@@ -52,14 +93,28 @@ class DataBus:
     def subscribe(self, topic: str):
         """
         Create a queue and register a subscriber for this topic.
-        Returns the asyncio.Queue instance for consumer tasks.
+        Returns a LaneQueue (asyncio.Queue API, priority-ordered get()) for consumer tasks.
         """
-        q = asyncio.Queue()
+        q = LaneQueue(scheduling=self.scheduling, weights=self.weights)
         self.subscribers.setdefault(topic, []).append(q)
         self.stats[topic]["subscribers"] = len(self.subscribers[topic])
         log.info(f"[Bus] Subscribed → {topic} (total {len(self.subscribers[topic])})")
+        for hook in self.subscribe_hooks:
+            try:
+                hook(topic)
+            except Exception as e:
+                log.error(f"[Bus] Subscribe hook error for {topic}: {e}")
         return q
 
+    # ───────────────────────────────────────────────────────────────
+    def unsubscribe(self, topic: str, q):
+        """Remove a subscriber queue previously returned by subscribe()."""
+        queues = self.subscribers.get(topic, [])
+        if q in queues:
+            queues.remove(q)
+            self.stats[topic]["subscribers"] = len(queues)
+            log.info(f"[Bus] Unsubscribed ← {topic} (total {len(queues)})")
+
     # ───────────────────────────────────────────────────────────────
     def get_stats(self):
         """
@@ -72,6 +127,7 @@ class DataBus:
                 "published": stat["published"],
                 "subscribers": stat["subscribers"],
                 "replay_depth": replay_count,
+                "queued": sum(q.qsize() for q in self.subscribers.get(topic, [])),
             }
         return report
 
@@ -86,11 +142,20 @@ class DataBus:
     async def attach_mqtt_bridge(self, bridge):
         """
         Attach external MQTT/WebSocket bridge.
-        Bridge must implement async publish(topic, data).
+        Bridge must implement async publish(topic, data, priority=None).
         """
         self.bridge = bridge
         log.info("[Bus] External bridge attached")
 
+    # ───────────────────────────────────────────────────────────────
+    def attach_aggregator(self, aggregator):
+        """
+        Insert a windowed aggregation stage in front of the bridge.
+        Aggregator must implement observe(topic, data) -> bool (forward raw?).
+        """
+        self.aggregator = aggregator
+        log.info("[Bus] Uplink aggregator attached")
+
     # ───────────────────────────────────────────────────────────────
     def detach_mqtt_bridge(self):
         """Remove the external bridge."""
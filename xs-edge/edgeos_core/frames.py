@@ -0,0 +1,109 @@
+import zlib
+from edgeos_core import codec as json_codec
+
+try:
+    import msgpack
+except ImportError:  # optional, falls back to JSON
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # optional, falls back to zlib
+    zstandard = None
+
+BATCH_TOPIC = "_batch"
+CONTENT_TYPE = "application/x-xs-batch"
+
+
+def resolve_codec(codec):
+    """Return the requested codec, or 'json' when msgpack is not installed."""
+    if codec == "msgpack" and msgpack is None:
+        return "json"
+    return codec if codec in ("json", "msgpack") else "json"
+
+
+def resolve_compression(compression):
+    """Return the requested compression, downgrading zstd → zlib if unavailable."""
+    if compression == "zstd" and zstandard is None:
+        return "zlib"
+    return compression if compression in ("none", "zlib", "zstd") else "zlib"
+
+
+class FrameBuilder:
+    """
+    Accumulates bus messages into a single uplink frame.
+
+    Each message is encoded once when added; the frame body is assembled by
+    concatenating the pre-encoded entries, so the pending byte count is exact
+    and building a frame never re-serializes the payloads.
+
+    Wire format:  b"<content-type>\\n" + compressed({"edge_id": ..., "messages": [[topic, ts, data], ...]})
+    """
+
+    def __init__(self, edge_id, codec="msgpack", compression="zlib", level=6):
+        self.edge_id = edge_id
+        self.codec = resolve_codec(codec)
+        self.compression = resolve_compression(compression)
+        self.level = level
+        self.content_type = f"{CONTENT_TYPE}+{self.codec};enc={self.compression}"
+        self._entries = []
+        self.pending_bytes = 0
+        if self.codec == "msgpack":
+            self._packer = msgpack.Packer()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, topic, ts, data):
+        """Encode and buffer one message. Returns the pending (uncompressed) size."""
+        if self.codec == "msgpack":
+            entry = self._packer.pack([topic, ts, data])
+        else:
+            entry = json_codec.dumps([topic, ts, data])
+        self._entries.append(entry)
+        self.pending_bytes += len(entry)
+        return self.pending_bytes
+
+    def build(self):
+        """Return the encoded frame and reset the buffer. Returns (frame, raw_size)."""
+        entries, self._entries, self.pending_bytes = self._entries, [], 0
+        if self.codec == "msgpack":
+            p = self._packer
+            body = (p.pack_map_header(2) + p.pack("edge_id") + p.pack(self.edge_id)
+                    + p.pack("messages") + p.pack_array_header(len(entries)) + b"".join(entries))
+        else:
+            body = (b'{"edge_id":' + json_codec.dumps(self.edge_id)
+                    + b',"messages":[' + b",".join(entries) + b"]}")
+        raw_size = len(body)
+        if self.compression == "zlib":
+            body = zlib.compress(body, self.level)
+        elif self.compression == "zstd":
+            body = zstandard.ZstdCompressor(level=self.level).compress(body)
+        return self.content_type.encode() + b"\n" + body, raw_size
+
+
+def decode_frame(payload):
+    """Decode a frame produced by FrameBuilder into {"edge_id", "messages"}."""
+    header, _, body = payload.partition(b"\n")
+    ctype, _, params = header.decode().partition(";")
+    if not ctype.startswith(CONTENT_TYPE + "+"):
+        raise ValueError(f"Unsupported frame content type: {ctype}")
+    codec = ctype.split("+", 1)[1]
+    enc = dict(p.split("=", 1) for p in params.split(";") if "=" in p).get("enc", "none")
+
+    if enc == "zlib":
+        body = zlib.decompress(body)
+    elif enc == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd frame received but zstandard is not installed")
+        body = zstandard.ZstdDecompressor().decompress(body)
+    elif enc != "none":
+        raise ValueError(f"Unsupported frame encoding: {enc}")
+
+    if codec == "msgpack":
+        if msgpack is None:
+            raise ValueError("msgpack frame received but msgpack is not installed")
+        return msgpack.unpackb(body, raw=False)
+    if codec == "json":
+        return json_codec.loads(body)
+    raise ValueError(f"Unsupported frame codec: {codec}")
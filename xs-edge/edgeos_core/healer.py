@@ -0,0 +1,213 @@
+import asyncio, collections, logging, os, sys, threading, time
+from edgeos_core import metrics, startup
+
+log = logging.getLogger("Healer")
+
+HEAL_INTERVAL = float(os.getenv("HEAL_INTERVAL", 10))
+HEARTBEAT_TIMEOUT = float(os.getenv("HEAL_HEARTBEAT_TIMEOUT", 30))
+QUEUE_LIMIT = int(os.getenv("HEAL_QUEUE_LIMIT", 1000))
+MQTT_RECYCLE_MIN = float(os.getenv("HEAL_MQTT_RECYCLE_MIN", 60))
+DB_REOPEN_LIMIT = int(os.getenv("HEAL_DB_REOPEN_LIMIT", 3))
+EXEC_AFTER = float(os.getenv("HEAL_EXEC_AFTER", 120))
+
+RECOVERIES = metrics.counter("xs_recoveries_total", "Self-healing actions taken", ["action", "result"])
+EVENT_TOPIC = "alert/recovery"
+
+
+class Healer:
+    """
+    Graduated in-process recovery, cheapest fix first:
+
+      1. restart one plugin — stale heartbeat, a subscriber queue that keeps
+         growing while nothing is consumed, or slow steps behind a loop stall
+      2. recycle the MQTT connections — dead listeners, or uplink messages
+         queued with no deliveries between two checks
+      3. reopen the SQLite connection — failed writes or a failed ping
+      4. re-exec the runtime — only when the loop has been blocked for
+         `exec_after` seconds or the DB cannot be reopened
+
+    check() runs on the loop every `interval`; the last-resort guard runs in
+    a thread, because a blocked loop cannot heal itself. Every action is
+    counted in xs_recoveries_total, kept in a short history and published
+    on alert/recovery.
+    """
+
+    def __init__(self, pm, bus, db, bridge=None, monitor=None, interval=HEAL_INTERVAL,
+                 heartbeat_timeout=HEARTBEAT_TIMEOUT, queue_limit=QUEUE_LIMIT,
+                 mqtt_recycle_min=MQTT_RECYCLE_MIN, db_reopen_limit=DB_REOPEN_LIMIT, exec_after=EXEC_AFTER):
+        self.pm, self.bus, self.db, self.bridge, self.monitor = pm, bus, db, bridge, monitor
+        self.interval = interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.queue_limit = queue_limit
+        self.mqtt_recycle_min = mqtt_recycle_min
+        self.db_reopen_limit = db_reopen_limit
+        self.exec_after = exec_after
+        self.history = collections.deque(maxlen=50)
+        self.counts = collections.Counter()
+        self._consumed = {}             # plugin → consumed count at the previous check
+        self._slow = {}                 # plugin → slow step count at the previous check
+        self._stalls = 0
+        self._delivered = None
+        self._last_recycle = 0.0
+        self._db_errors = db.errors
+        self._db_failures = 0
+        self._stop = threading.Event()
+
+    # ───────────────────────────────────────────────────────────────
+    async def run(self, stop_event):
+        if self.monitor and self.exec_after:
+            threading.Thread(target=self._guard, name="healer-guard", daemon=True).start()
+        try:
+            while not stop_event.is_set():
+                await asyncio.sleep(self.interval)
+                try:
+                    await self.check()
+                except Exception as e:
+                    log.error(f"[Healer] Check failed: {e}")
+        finally:
+            self._stop.set()
+
+    async def check(self):
+        await self._check_plugins()
+        await self._check_mqtt()
+        await self._check_db()
+        await self.pm.check_circuits()
+
+    async def record(self, action, target, reason, ok=True):
+        event = {"ts": time.time(), "action": action, "target": target, "reason": reason, "ok": ok}
+        self.history.append(event)
+        self.counts[action] += 1
+        RECOVERIES.labels(action, "ok" if ok else "failed").inc()
+        (log.warning if ok else log.error)(f"[Healer] {action} {target}: {reason}{'' if ok else ' — failed'}")
+        try:
+            await self.bus.publish(EVENT_TOPIC, event)
+        except Exception as e:
+            log.error(f"[Healer] Could not publish recovery event: {e}")
+
+    # ───────────────────────────────────────────────────────────────
+    # 1. PLUGINS
+    # ───────────────────────────────────────────────────────────────
+    async def _check_plugins(self):
+        now = time.time()
+        stalls = self.monitor.stalls if self.monitor else 0
+        stalled, self._stalls = stalls > self._stalls, stalls
+        sick = {}
+
+        for name, plugin in list(self.pm.plugins.items()):
+            sup = self.pm.supervisors.get(name)
+            if sup and sup.state != "running":
+                continue        # crashed and backing off, or circuit open — already handled
+            last_hb = getattr(plugin, "last_heartbeat", None)
+            timeout = self.pm.heartbeat_timeout(name, self.heartbeat_timeout)
+            if last_hb and now - last_hb > timeout:
+                sick[name] = f"heartbeat stale >{timeout:.0f} s"
+                continue
+            stats = self.pm.stats.get(name)
+            if stats is None:
+                continue
+            consumed = stats.summary()["consumed"]
+            backlog = sum(q.qsize() for q in stats.queues)
+            if backlog > self.queue_limit and consumed == self._consumed.get(name):
+                sick[name] = f"{backlog} messages queued and none consumed in {self.interval:.0f} s"
+            self._consumed[name] = consumed
+
+        # A loop stall is pinned on the plugin with the most slow steps since the last check
+        slow = {name: st.slow_count - self._slow.get(name, 0) for name, st in self.pm.stats.items()}
+        self._slow = {name: st.slow_count for name, st in self.pm.stats.items()}
+        if stalled:
+            culprit = max(slow, key=slow.get, default=None)
+            if culprit and slow[culprit] > 0 and culprit not in sick:
+                sick[culprit] = f"blocked the event loop ({slow[culprit]} slow steps)"
+
+        for name, reason in sick.items():
+            try:
+                restarted = await self.pm.restart(name, reason)
+                await self.record("restart_plugin" if restarted else "disable_plugin", name, reason)
+            except Exception as e:
+                await self.record("restart_plugin", name, f"{reason}: {e}", ok=False)
+            self._consumed.pop(name, None)
+
+    # ───────────────────────────────────────────────────────────────
+    # 2. MQTT
+    # ───────────────────────────────────────────────────────────────
+    async def _check_mqtt(self):
+        bridge = self.bridge
+        if not bridge or not bridge.running:
+            return
+        delivered = sum(st["delivered"] for st in bridge.delivery_stats.values())
+        queued = sum(bridge.get_delivery_stats()["queued"].values())
+        reason = None
+        if not bridge.listeners_alive():
+            reason = "command / rule listener stopped"
+        elif queued and delivered == self._delivered:
+            reason = f"{queued} uplink messages queued, none delivered in {self.interval:.0f} s"
+        self._delivered = delivered
+
+        if reason and time.monotonic() - self._last_recycle >= self.mqtt_recycle_min:
+            self._last_recycle = time.monotonic()
+            try:
+                await bridge.recycle()
+                await self.record("recycle_mqtt", bridge.broker, reason)
+            except Exception as e:
+                await self.record("recycle_mqtt", bridge.broker, f"{reason}: {e}", ok=False)
+
+    # ───────────────────────────────────────────────────────────────
+    # 3. DATABASE
+    # ───────────────────────────────────────────────────────────────
+    async def _check_db(self):
+        reason = None
+        if self.db.errors > self._db_errors:
+            reason = f"{self.db.errors - self._db_errors} failed writes"
+        else:
+            try:
+                self.db.ping()
+            except Exception as e:
+                reason = f"ping failed: {e}"
+        self._db_errors = self.db.errors
+        if reason is None:
+            self._db_failures = 0
+            return
+
+        try:
+            self.db.reopen()
+            self.db.ping()
+            self._db_failures = 0
+            await self.record("reopen_db", self.db.path, reason)
+        except Exception as e:
+            self._db_failures += 1
+            await self.record("reopen_db", self.db.path, f"{reason}: {e}", ok=False)
+            if self._db_failures >= self.db_reopen_limit:
+                self.reexec(f"database could not be reopened {self._db_failures} times")
+
+    # ───────────────────────────────────────────────────────────────
+    # 4. LAST RESORT
+    # ───────────────────────────────────────────────────────────────
+    def _guard(self):
+        while not self._stop.wait(1):
+            blocked = self.monitor.blocked_for()
+            if blocked > self.exec_after:
+                self.reexec(f"event loop blocked for {blocked:.0f} s")
+
+    def reexec(self, reason):
+        """
+        Replace the process with a fresh runtime; last resort only. Replay
+        buffers and rule state are saved to the warm snapshot first, best
+        effort — this may run on the guard thread while the loop is blocked.
+        """
+        self.counts["reexec"] += 1
+        RECOVERIES.labels("reexec", "ok").inc()
+        log.critical(f"[Healer] Re-executing runtime: {reason}")
+        try:
+            startup.save_snapshot(startup.SNAPSHOT_PATH, self.bus, self.pm.rules)
+        except Exception as e:      # e.g. a buffer mutated mid-copy; exec anyway
+            log.error(f"[Healer] Snapshot before re-exec failed: {e}")
+        for handler in logging.getLogger().handlers:
+            handler.flush()
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    def get_stats(self):
+        return {
+            "interval": self.interval,
+            "actions": dict(self.counts),
+            "recent": list(self.history)[-10:],
+        }
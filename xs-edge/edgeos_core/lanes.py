@@ -0,0 +1,89 @@
+import asyncio, collections
+
+# Priority classes, highest first
+CONTROL, ALERT, TELEMETRY = 0, 1, 2
+LANE_NAMES = ("control", "alert", "telemetry")
+DEFAULT_WEIGHTS = (8, 4, 1)
+
+
+def priority_for(topic):
+    """
+    Default priority class for a bus topic:
+    command / rule-update ACKs are control-plane, alert/# are alerts,
+    everything else is telemetry.
+    """
+    if topic.startswith("ack/"):
+        return CONTROL
+    if topic.startswith("alert/"):
+        return ALERT
+    return TELEMETRY
+
+
+def parse_weights(value):
+    """'8,4,1' → (8, 4, 1); falls back to DEFAULT_WEIGHTS on bad input."""
+    try:
+        weights = tuple(int(w) for w in str(value).split(","))
+        return weights if len(weights) == len(LANE_NAMES) else DEFAULT_WEIGHTS
+    except ValueError:
+        return DEFAULT_WEIGHTS
+
+
+class LaneQueue(asyncio.Queue):
+    """
+    asyncio.Queue with one FIFO lane per priority class.
+
+    put((priority, item)) enqueues into that lane; get() returns the bare
+    item chosen by the scheduling policy:
+
+      strict    always drain the highest non-empty lane first
+      weighted  per round, lane i may be served weights[i] times before the
+                round resets, so telemetry keeps moving under control bursts
+    """
+
+    def __init__(self, maxsize=0, scheduling="strict", weights=DEFAULT_WEIGHTS):
+        self.scheduling = scheduling
+        self.weights = tuple(weights)
+        super().__init__(maxsize)
+
+    def _init(self, maxsize):
+        self._lanes = [collections.deque() for _ in LANE_NAMES]
+        self._queue = self._lanes       # used by asyncio.Queue.__repr__
+        self._credits = list(self.weights)
+        self.consumed = 0               # items handed out by get(), for consumer accounting
+
+    def _qsize(self):
+        return sum(len(lane) for lane in self._lanes)
+
+    # asyncio.Queue reads len(self._queue) directly for these
+    def qsize(self):
+        return self._qsize()
+
+    def empty(self):
+        return not self._qsize()
+
+    def full(self):
+        return 0 < self._maxsize <= self._qsize()
+
+    def _put(self, entry):
+        priority, item = entry
+        self._lanes[priority].append(item)
+
+    def _get(self):
+        self.consumed += 1
+        lanes = self._lanes
+        if self.scheduling == "weighted":
+            for _ in range(2):
+                for i, lane in enumerate(lanes):
+                    if lane and self._credits[i] > 0:
+                        self._credits[i] -= 1
+                        return lane.popleft()
+                self._credits = list(self.weights)
+        for lane in lanes:
+            if lane:
+                return lane.popleft()
+
+    def lane_size(self, priority):
+        return len(self._lanes[priority])
+
+    def lane_sizes(self):
+        return {name: len(lane) for name, lane in zip(LANE_NAMES, self._lanes)}
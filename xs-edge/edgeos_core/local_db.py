@@ -1,7 +1,87 @@
-import sqlite3,time
+import sqlite3,time,base64
+from edgeos_core import metrics
+
+DB_WRITE = metrics.histogram("xs_db_write_seconds", "Event insert + commit latency")
 class DBManager:
     def __init__(self, path):
-        self.conn=sqlite3.connect(path,check_same_thread=False)
-        self.conn.execute("CREATE TABLE IF NOT EXISTS events(ts REAL,rule TEXT,data TEXT)")
+        self.path=path
+        self.errors=0               # failed writes, watched by the healer
+        self.conn=self._open()
+    def _open(self):
+        conn=sqlite3.connect(self.path,check_same_thread=False)
+        conn.execute("CREATE TABLE IF NOT EXISTS events(ts REAL,rule TEXT,data TEXT)")
+        # keyset pagination walks (ts, rowid); filtered queries start from the rule/topic
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_events_rule_ts ON events(rule,ts)")
+        return conn
     def insert_event(self,rule,data):
-        self.conn.execute("INSERT INTO events VALUES(?,?,?)",(time.time(),rule,str(data)));self.conn.commit()
+        try:
+            with DB_WRITE.time():
+                self.conn.execute("INSERT INTO events VALUES(?,?,?)",(time.time(),rule,str(data)));self.conn.commit()
+        except sqlite3.Error:
+            self.errors+=1
+            raise
+    def ping(self):
+        """Cheap liveness check: raises if the connection can no longer read the table."""
+        self.conn.execute("SELECT rowid FROM events LIMIT 1").fetchall()
+    def reopen(self):
+        """Replace the connection in place; everything holding this DBManager keeps working."""
+        old,self.conn=self.conn,self._open()
+        try: old.close()
+        except sqlite3.Error: pass
+
+    # ───────────────────────────────────────────────────────────────
+    # QUERIES
+    # ───────────────────────────────────────────────────────────────
+    def query_events(self, topic=None, rules=None, since=None, until=None, after=None, limit=100, desc=False):
+        """
+        One page of events, ordered by (ts, rowid).
+        `rule` holds a rule name for rule hits and the topic for persisted bus messages:
+        `topic` matches it exactly or, ending in '#', by prefix; `rules` is a list of exact names.
+        `after` is the (ts, rowid) of the last row of the previous page.
+        Returns [(rowid, ts, rule, data), ...].
+        """
+        where, args = [], []
+        if topic:
+            if topic.endswith("#"):
+                where.append("rule LIKE ? ESCAPE '\\'")
+                args.append(topic[:-1].replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+            else:
+                where.append("rule = ?"); args.append(topic)
+        if rules:
+            where.append(f"rule IN ({','.join('?' * len(rules))})"); args.extend(rules)
+        if since is not None:
+            where.append("ts >= ?"); args.append(since)
+        if until is not None:
+            where.append("ts < ?"); args.append(until)
+        if after is not None:
+            where.append(f"(ts, rowid) {'<' if desc else '>'} (?, ?)"); args.extend(after)
+        order = "DESC" if desc else "ASC"
+        sql = (f"SELECT rowid, ts, rule, data FROM events {'WHERE ' + ' AND '.join(where) if where else ''} "
+               f"ORDER BY ts {order}, rowid {order} LIMIT ?")
+        return self.conn.execute(sql, args + [limit]).fetchall()
+
+    def iter_events(self, chunk=1000, **filters):
+        """
+        Yield events in chunks of up to `chunk` rows. Each chunk is its own
+        short keyset query, so no statement stays open between chunks.
+        """
+        after = filters.pop("after", None)
+        while True:
+            rows = self.query_events(after=after, limit=chunk, **filters)
+            if not rows:
+                return
+            yield rows
+            if len(rows) < chunk:
+                return
+            after = (rows[-1][1], rows[-1][0])
+
+
+def encode_cursor(ts, rowid):
+    return base64.urlsafe_b64encode(f"{ts!r}:{rowid}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Opaque page cursor → (ts, rowid); raises ValueError if malformed."""
+    ts, rowid = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+    return float(ts), int(rowid)
@@ -0,0 +1,202 @@
+import bisect, math, time
+
+# ───────────────────────────────────────────────────────────────
+# Minimal Prometheus-style metrics (text exposition 0.0.4)
+#
+# Hot-path updates are plain attribute / list arithmetic on the event loop
+# thread — no locks, no allocation once a labelled child exists. Values
+# that other components already track (bus stats, bridge stats, plugin
+# accounting) are read at scrape time through collectors instead.
+# ───────────────────────────────────────────────────────────────
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _fmt_value(v):
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._children = {}
+        if not self.label_names:
+            self._children[()] = self._new_child()
+
+    def labels(self, *values):
+        """Child for a label combination; keep a reference to it on hot paths."""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def __getattr__(self, attr):
+        # unlabelled metrics: counter.inc() etc. go to the single child
+        if attr.startswith("_") or self.label_names:
+            raise AttributeError(attr)
+        return getattr(self._children[()], attr)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(child.samples(self.name, self.label_names, values))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def samples(self, name, names, values):
+        return [f"{name}{_fmt_labels(names, values)} {_fmt_value(self.value)}"]
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, v):
+        self.value = v
+
+    def dec(self, n=1):
+        self.value -= n
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v):
+        self.counts[bisect.bisect_left(self.bounds, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def samples(self, name, names, values):
+        out, cumulative = [], 0
+        for bound, n in zip(self.bounds + (math.inf,), self.counts):
+            cumulative += n
+            out.append(f"{name}_bucket{_fmt_labels(names, values, {'le': _fmt_value(bound)})} {cumulative}")
+        out.append(f"{name}_sum{_fmt_labels(names, values)} {_fmt_value(self.sum)}")
+        out.append(f"{name}_count{_fmt_labels(names, values)} {self.count}")
+        return out
+
+
+class _Timer:
+    __slots__ = ("child", "t0")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.t0)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labels)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []            # callables → [(name, kind, help, [(labels dict, value), ...]), ...]
+
+    def _add(self, metric):
+        existing = self.metrics.get(metric.name)
+        if existing is not None:
+            return existing             # re-imported modules (plugin reloads) share the series
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def collector(self, fn):
+        """Register a scrape-time collector; usable as a decorator."""
+        self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        for fn in self.collectors:
+            for name, kind, help, samples in fn():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_fmt_labels(labels.keys(), labels.values())} {_fmt_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+collector = REGISTRY.collector
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ───────────────────────────────────────────────────────────────
+# Event loop lag (recorded by profiler.LoopMonitor)
+# ───────────────────────────────────────────────────────────────
+LOOP_LAG = histogram("xs_loop_lag_seconds", "Delay of a timer wake-up on the main event loop",
+                     buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+
@@ -1,17 +1,31 @@
-import asyncio, json, logging, random, sys
+import asyncio, logging, random, sys, time
 from aiomqtt import Client, MqttError
 from edgeos_core.command_handler import CommandHandler
 from edgeos_core.rules_sync import RulesSync
+from edgeos_core.frames import FrameBuilder, BATCH_TOPIC
+from edgeos_core.uplink_policy import UplinkPolicies
+from edgeos_core.lanes import LaneQueue, priority_for, TELEMETRY, DEFAULT_WEIGHTS
+from edgeos_core import codec, metrics
 
 log = logging.getLogger("MQTTBridge")
 
+# Delivery classes, indexed by lane priority (control → ack)
+TOPIC_CLASSES = ("ack", "alert", "telemetry")
+
+BATCH_SIZE = metrics.histogram("xs_uplink_batch_messages", "Messages per uplink batch frame",
+                               buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+
 class MQTTBridge:
     """
     MQTT Bridge for XS Edge ↔ Controller communication.
     Works with aiomqtt >=2.4.
     """
 
-    def __init__(self, broker="broker.hivemq.com", port=8000, edge_id=None, rules_engine=None, bus=None):
+    def __init__(self, broker="broker.hivemq.com", port=8000, edge_id=None, rules_engine=None, bus=None,
+                 batch_ms=0, batch_bytes=16384, batch_codec="msgpack", batch_compression="zlib",
+                 policies=None, qos=None, inflight=32, queue_size=1000, max_retries=5,
+                 scheduling="strict", weights=DEFAULT_WEIGHTS):
         self.broker = broker
         self.port = port
         self.edge_id = edge_id or f"xsedge-{random.randint(1000,9999)}"
@@ -23,6 +37,34 @@ class MQTTBridge:
         self.command_handler = CommandHandler(self.rules_engine)
         self.rules_sync = RulesSync(self.rules_engine, self.bus)
 
+        # Uplink batching (disabled when batch_ms == 0)
+        self.batch_ms = batch_ms
+        self.batch_bytes = batch_bytes
+        self.frames = FrameBuilder(self.edge_id, batch_codec, batch_compression) if batch_ms > 0 else None
+        self._flush_timer = None
+        self._frame_topics = set()          # bus topics in the frame being built
+        self.uplink_stats = {"frames": 0, "messages_batched": 0, "bytes_raw": 0, "bytes_sent": 0}
+
+        # Per-topic sampling / deadband / delta policies
+        self.policies = policies or UplinkPolicies()
+
+        # Uplink delivery: one persistent connection with a bounded in-flight window
+        self.qos = {"telemetry": 0, "ack": 1, "alert": 1, **(qos or {})}
+        self.inflight_max = inflight
+        self.max_retries = max_retries
+        self.queue_size = queue_size        # bound on queued telemetry; control/alert lanes are unbounded
+        self._uplink = LaneQueue(scheduling=scheduling, weights=weights)
+        self._inflight = asyncio.Semaphore(inflight)
+        self.inflight = 0                   # publishes handed to _deliver and not yet finished
+        self._uplink_task = None
+        self._listeners = []
+        self._uplink_broken = False
+        self.delivery_stats = {
+            c: {"sent": 0, "delivered": 0, "failed": 0, "retries": 0, "dropped": 0,
+                "latency_ms_avg": 0.0, "latency_ms_max": 0.0}
+            for c in TOPIC_CLASSES
+        }
+
         # ✅ Windows event loop fix
         if sys.platform == "win32":
             asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
@@ -35,9 +77,8 @@ class MQTTBridge:
             self.running = True
             self.connected.set()
 
-            # Start listeners in background
-            asyncio.create_task(self._listen_for_commands())
-            asyncio.create_task(self._listen_for_rules())
+            # Start uplink sender and listeners in background
+            self._start_tasks()
 
             log.info("[Bridge] Connected to broker ✅")
             await self.send_registration()
@@ -45,30 +86,183 @@ class MQTTBridge:
             log.error(f"[Bridge] Connection failed: {e}")
             self.running = False
 
+    def _start_tasks(self):
+        self._uplink_task = asyncio.create_task(self._uplink_loop())
+        self._listeners = [asyncio.create_task(self._listen_for_commands()),
+                           asyncio.create_task(self._listen_for_rules())]
+
+    def listeners_alive(self):
+        """False once a command / rule listener has died (they do not reconnect on their own)."""
+        return all(not t.done() for t in self._listeners)
+
+    async def recycle(self):
+        """
+        Tear down and re-create every broker connection. Queued uplink
+        messages stay in their lanes and go out on the new connection.
+        """
+        log.warning("[Bridge] Recycling MQTT connections")
+        tasks = [t for t in [self._uplink_task, *self._listeners] if t]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.client = None
+        self.running = True
+        self._start_tasks()
+
     # ───────────────────────────────────────────────
-    async def publish(self, topic, data):
-        """Publish JSON message to MQTT broker."""
+    async def publish(self, topic, data, priority=None):
+        """Publish JSON message to MQTT broker, or buffer it into the current batch frame."""
         if not self.running:
             log.warning("[Bridge] Publish attempted before connection.")
             return
 
+        data = self.policies.filter(topic, data)
+        if data is None:
+            return
+
+        if priority is None:
+            priority = priority_for(topic)
+        if self.frames is not None and priority == TELEMETRY:
+            self.frames.add(topic, time.time(), data)
+            self._frame_topics.add(topic)
+            if self.frames.pending_bytes >= self.batch_bytes:
+                await self.flush_batch()
+            elif self._flush_timer is None:
+                loop = asyncio.get_running_loop()
+                self._flush_timer = loop.call_later(
+                    self.batch_ms / 1000, lambda: asyncio.ensure_future(self.flush_batch())
+                )
+            return
+
+        payload = codec.dumps({
+            "edge_id": self.edge_id,
+            "topic": topic,
+            "data": data
+        })
+        await self._publish_raw(f"xsedge/{self.edge_id}/{topic}", payload, priority, (topic,))
+
+    # ───────────────────────────────────────────────
+    async def flush_batch(self):
+        """Send all buffered messages as one compressed frame."""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if not self.frames:
+            return
+
+        count = len(self.frames)
+        frame, raw_size = self.frames.build()
+        topics, self._frame_topics = tuple(self._frame_topics), set()
+        self.uplink_stats["frames"] += 1
+        self.uplink_stats["messages_batched"] += count
+        self.uplink_stats["bytes_raw"] += raw_size
+        self.uplink_stats["bytes_sent"] += len(frame)
+        BATCH_SIZE.observe(count)
+        await self._publish_raw(f"xsedge/{self.edge_id}/{BATCH_TOPIC}", frame, TELEMETRY, topics)
+        log.debug(f"[Bridge] Flushed batch of {count} msgs ({raw_size} → {len(frame)} bytes)")
+
+    # ───────────────────────────────────────────────
+    async def _publish_raw(self, mqtt_topic, payload, priority=TELEMETRY, topics=()):
+        """
+        Queue an already-encoded payload on its priority lane for the uplink sender.
+        Telemetry is dropped once `queue_size` telemetry items are waiting.
+        `topics` are the bus topics carried by the payload; if it is dropped,
+        their delta baselines are reset so the next message is a keyframe.
+        """
+        if priority == TELEMETRY and self._uplink.lane_size(TELEMETRY) >= self.queue_size:
+            self.delivery_stats["telemetry"]["dropped"] += 1
+            self.policies.resync(topics)
+            log.debug(f"[Bridge] Uplink queue full, dropped {mqtt_topic}")
+            return
+        self._uplink.put_nowait((priority, [mqtt_topic, payload, priority, time.monotonic(), 0, topics]))
+
+    # ───────────────────────────────────────────────
+    async def _uplink_loop(self):
+        """
+        Own the uplink connection and pipeline publishes through it.
+        Up to `inflight_max` publishes are outstanding at once, so QoS 1 acks
+        and alerts never wait for PUBACKs of earlier bulk telemetry, and the
+        lane queue hands the next free slot to the highest-priority message.
+        """
+        while self.running:
+            try:
+                async with Client(
+                    self.broker,
+                    self.port,
+                    identifier=f"{self.edge_id}-uplink",
+                    transport="websockets",
+                    websocket_path="/mqtt",
+                    max_inflight_messages=self.inflight_max,
+                ) as client:
+                    self.client = client
+                    self._uplink_broken = False
+                    log.info("[Bridge] Uplink connection established")
+                    while True:
+                        # Take the in-flight slot first: nothing is dequeued until it can be
+                        # handed to _deliver, so a cancel (recycle / disconnect) never loses an item
+                        await self._inflight.acquire()
+                        try:
+                            item = await self._uplink.get()
+                        except BaseException:
+                            self._inflight.release()
+                            raise
+                        if self._uplink_broken:
+                            self._inflight.release()
+                            self._uplink.task_done()
+                            self._uplink.put_nowait((item[2], item))
+                            raise MqttError("uplink connection lost")
+                        self.inflight += 1
+                        asyncio.create_task(self._deliver(client, item))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning(f"[Bridge] Uplink error: {e}, reconnecting in 5 s")
+            self.client = None
+            await asyncio.sleep(5)
+
+    async def _deliver(self, client, item):
+        """Publish one queued item; QoS > 0 failures are retried with backoff."""
+        mqtt_topic, payload, priority, enqueued, attempts, topics = item
+        cls = TOPIC_CLASSES[priority]
+        stats = self.delivery_stats[cls]
+        qos = self.qos[cls]
         try:
-            async with Client(
-                self.broker,
-                self.port,
-                transport="websockets",
-                websocket_path="/mqtt"
-            ) as client:
-                client._client_id = self.edge_id.encode()
-                payload = json.dumps({
-                    "edge_id": self.edge_id,
-                    "topic": topic,
-                    "data": data
-                })
-                await client.publish(f"xsedge/{self.edge_id}/{topic}", payload.encode())
-                log.debug(f"[Bridge] Published → xsedge/{self.edge_id}/{topic}")
+            if attempts == 0:
+                stats["sent"] += 1
+            await client.publish(mqtt_topic, payload, qos=qos, timeout=30)
+            latency = (time.monotonic() - enqueued) * 1000
+            stats["delivered"] += 1
+            stats["latency_ms_avg"] += (latency - stats["latency_ms_avg"]) / stats["delivered"]
+            stats["latency_ms_max"] = max(stats["latency_ms_max"], latency)
+            log.debug(f"[Bridge] Published → {mqtt_topic} (qos {qos}, {latency:.0f} ms)")
         except Exception as e:
-            log.error(f"[Bridge] Publish failed: {e}")
+            if isinstance(e, MqttError):
+                self._uplink_broken = True
+            if qos > 0 and attempts < self.max_retries:
+                stats["retries"] += 1
+                item[4] = attempts + 1
+                asyncio.create_task(self._requeue(item, min(2 ** attempts, 30)))
+            else:
+                stats["failed"] += 1
+                self.policies.resync(topics)
+                log.error(f"[Bridge] Publish failed for {mqtt_topic}: {e}")
+        finally:
+            self.inflight -= 1
+            self._inflight.release()
+            self._uplink.task_done()
+
+    async def _requeue(self, item, delay):
+        await asyncio.sleep(delay)
+        self._uplink.put_nowait((item[2], item))
+
+    def get_delivery_stats(self):
+        """Per-class delivery counters plus current queue / in-flight depth."""
+        return {
+            "qos": dict(self.qos),
+            "queued": self._uplink.lane_sizes(),
+            "inflight": self.inflight,
+            "classes": {c: dict(st) for c, st in self.delivery_stats.items()},
+        }
 
     # ───────────────────────────────────────────────
     async def _listen_for_commands(self):
@@ -128,7 +322,7 @@ class MQTTBridge:
             ) as client:
                 client._client_id = self.edge_id.encode()
                 log.debug(f"[Bridge] Publishing registration to topic: xsedge/register")
-                await client.publish("xsedge/register", json.dumps(payload).encode(), qos=1, retain=True)
+                await client.publish("xsedge/register", codec.dumps(payload), qos=1, retain=True)
                 log.info(f"[Bridge] Registration sent → {payload}")
         except Exception as e:
             log.error(f"[Bridge] Registration failed: {e}")
@@ -138,7 +332,17 @@ class MQTTBridge:
     async def disconnect(self):
         """Gracefully close connection."""
         try:
+            if self.frames is not None:
+                await self.flush_batch()
+            try:
+                await asyncio.wait_for(self._uplink.join(), timeout=5)
+            except asyncio.TimeoutError:
+                log.warning(f"[Bridge] {self._uplink.qsize()} uplink messages undelivered at shutdown")
             self.running = False
+            if self._uplink_task:
+                self._uplink_task.cancel()
+            for t in self._listeners:
+                t.cancel()
             log.info("[Bridge] Disconnected from broker")
         except Exception as e:
             log.warning(f"[Bridge] Disconnect error: {e}")
@@ -0,0 +1,473 @@
+import asyncio, importlib.machinery, importlib.util, logging, multiprocessing, os, queue, threading, time
+from edgeos_core.scheduler import Scheduler
+from edgeos_core.accounting import PluginStats, run_accounted
+from edgeos_core.supervisor import Supervisor
+
+log = logging.getLogger("PluginHost")
+
+PLUGIN_THREAD_START_TIMEOUT = 30
+PLUGIN_IPC_QUEUE = int(os.getenv("PLUGIN_IPC_QUEUE", 1000))    # messages buffered for a child's pipe
+
+# ───────────────────────────────────────────────────────────────
+# Execution modes for plugins (plugin.yaml → mode: inproc | thread | process)
+#
+#   inproc   Plugin runs on the main event loop (default, handled by PluginManager)
+#   thread   Plugin runs on its own event loop in a dedicated thread; bus, rules
+#            and db calls hop back to the main loop
+#   process  Plugin runs in a child interpreter; bus, rules and db calls travel
+#            over a multiprocessing pipe, with heartbeats and crash restarts
+# ───────────────────────────────────────────────────────────────
+
+
+class _SourceLoader(importlib.machinery.SourceFileLoader):
+    """Compile a plugin's entry module from its (verified) source; never read or write __pycache__."""
+
+    def get_code(self, fullname):
+        path = self.get_filename(fullname)
+        return self.source_to_code(self.get_data(path), path)
+
+
+def load_plugin_module(name, code):
+    spec = importlib.util.spec_from_file_location(name, code, loader=_SourceLoader(name, code))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def load_plugin_class(name, code):
+    return load_plugin_module(name, code).Plugin
+
+
+async def supervise(plugin, name, supervisor=None):
+    """Run plugin.on_start under a Supervisor (backoff, circuit breaking). A normal return ends supervision."""
+    await (supervisor or Supervisor(name)).run(plugin.on_start)
+
+
+async def run_plugin(plugin, name, stats=None, supervisor=None):
+    """
+    Give the plugin its own Scheduler on the current loop, then supervise it until cancelled.
+    With `stats`, the plugin's task steps and job runs are accounted to it.
+    """
+    plugin.scheduler = Scheduler()
+    if stats:
+        plugin.scheduler.instrument = lambda job, aw: run_accounted(aw, stats, iteration=True)
+    sched = plugin.scheduler.start()
+    try:
+        main = supervise(plugin, name, supervisor)
+        await (run_accounted(main, stats) if stats else main)
+        await sched
+    finally:
+        sched.cancel()
+
+
+# ───────────────────────────────────────────────────────────────
+# INPROC MODE
+# ───────────────────────────────────────────────────────────────
+class PluginBus:
+    """
+    Per-plugin DataBus facade for in-process plugins.
+    Records the plugin's subscriptions so they can be drained and removed on unload.
+    """
+
+    def __init__(self, bus, name, stats=None):
+        self._bus = bus
+        self.name = name
+        self.stats = stats or PluginStats(name)
+        self.subscriptions = []         # [(topic, queue), ...]
+
+    async def publish(self, topic, data, priority=None):
+        self.stats.published += 1
+        await self._bus.publish(topic, data, priority)
+
+    def subscribe(self, topic):
+        q = self._bus.subscribe(topic)
+        self.subscriptions.append((topic, q))
+        self.stats.queues.append(q)
+        return q
+
+    def detach(self):
+        """Stop delivery to this plugin's queues (they keep what is already queued)."""
+        for topic, q in self.subscriptions:
+            self._bus.unsubscribe(topic, q)
+
+    def pending(self):
+        return sum(q.qsize() for _, q in self.subscriptions)
+
+    def __getattr__(self, name):
+        return getattr(self._bus, name)
+
+
+# ───────────────────────────────────────────────────────────────
+# THREAD MODE
+# ───────────────────────────────────────────────────────────────
+class _ThreadBus:
+    """DataBus facade for a plugin running on another loop; every call hops to the main loop."""
+
+    def __init__(self, bus, main_loop, stats):
+        self._bus = bus
+        self._main = main_loop
+        self._forwarders = []
+        self.stats = stats
+
+    async def publish(self, topic, data, priority=None):
+        self.stats.published += 1
+        fut = asyncio.run_coroutine_threadsafe(self._bus.publish(topic, data, priority), self._main)
+        await asyncio.wrap_future(fut)
+
+    def subscribe(self, topic):
+        plugin_loop = asyncio.get_event_loop()
+        local_q = asyncio.Queue()
+
+        def attach():
+            q = self._bus.subscribe(topic)
+
+            async def forward():
+                try:
+                    while True:
+                        item = await q.get()
+                        self.stats.consumed += 1
+                        plugin_loop.call_soon_threadsafe(local_q.put_nowait, item)
+                finally:
+                    self._bus.unsubscribe(topic, q)
+
+            self._forwarders.append(self._main.create_task(forward()))
+
+        self._main.call_soon_threadsafe(attach)
+        return local_q
+
+    def close(self):
+        for t in self._forwarders:
+            self._main.call_soon_threadsafe(t.cancel)
+        self._forwarders = []
+
+    def __getattr__(self, name):
+        return getattr(self._bus, name)
+
+
+class _ThreadCall:
+    """Forwards synchronous calls (rules.evaluate, db.insert_event) to the main loop thread."""
+
+    def __init__(self, target, main_loop):
+        self._target = target
+        self._main = main_loop
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            self._main.call_soon_threadsafe(lambda: attr(*args, **kwargs))
+
+        return call
+
+
+class ThreadPlugin:
+    """Handle for a plugin running on its own event loop in a dedicated thread."""
+
+    mode = "thread"
+
+    def __init__(self, name, code, meta, bus, db, rules, supervisor=None):
+        self.name, self.code, self.meta = name, code, meta
+        self.bus, self.db, self.rules = bus, db, rules
+        self.supervisor = supervisor or Supervisor(name)
+        self.plugin = None
+        self.loop = None
+        self.thread = None
+        self._task = None
+        self._bus_proxy = None
+        self.ready = None               # resolved on the main loop once the plugin is constructed
+        self.stats = PluginStats(name)
+
+    @property
+    def last_heartbeat(self):
+        return getattr(self.plugin, "last_heartbeat", None)
+
+    def start(self):
+        """Start the plugin thread without waiting for it; a slow __init__ never blocks the main loop."""
+        main = asyncio.get_running_loop()
+        self.ready = main.create_future()
+        self.thread = threading.Thread(target=self._run, args=(main,), name=f"plugin-{self.name}", daemon=True)
+        self.thread.start()
+
+    def _set_ready(self):
+        if not self.ready.done():
+            self.ready.set_result(None)
+
+    def _run(self, main):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            cls = load_plugin_class(self.name, self.code)
+            self._bus_proxy = _ThreadBus(self.bus, main, self.stats)
+            self.plugin = cls(self._bus_proxy, _ThreadCall(self.db, main), _ThreadCall(self.rules, main), self.meta)
+            self._task = self.loop.create_task(run_plugin(self.plugin, self.name, self.stats, self.supervisor))
+        except Exception as e:
+            log.error(f"[{self.name}] failed to start in thread: {e}")
+            return
+        finally:
+            try:
+                main.call_soon_threadsafe(self._set_ready)
+            except RuntimeError:        # main loop already closed
+                pass
+        try:
+            self.loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.loop.close()
+
+    async def on_stop(self):
+        if self.ready is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(self.ready), PLUGIN_THREAD_START_TIMEOUT)
+            except asyncio.TimeoutError:
+                log.error(f"[{self.name}] still initialising after {PLUGIN_THREAD_START_TIMEOUT} s — abandoning its thread")
+                return
+        if self.loop is None or self.loop.is_closed():
+            return
+        if hasattr(self.plugin, "on_stop"):
+            try:
+                fut = asyncio.run_coroutine_threadsafe(self.plugin.on_stop(), self.loop)
+                await asyncio.wait_for(asyncio.wrap_future(fut), timeout=10)
+            except Exception as e:
+                log.error(f"[{self.name}] error on stop: {e}")
+        if self._bus_proxy:
+            self._bus_proxy.close()
+        if self._task:
+            self.loop.call_soon_threadsafe(self._task.cancel)
+
+
+# ───────────────────────────────────────────────────────────────
+# PROCESS MODE — child side
+# ───────────────────────────────────────────────────────────────
+def child_main(name, code, meta, conn, heartbeat_interval=5):
+    """Entry point of a plugin worker process."""
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    try:
+        asyncio.run(_child(name, code, meta, conn, heartbeat_interval))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _child(name, code, meta, conn, heartbeat_interval):
+    loop = asyncio.get_running_loop()
+    subs = {}                               # topic → [asyncio.Queue, ...]
+    stop = asyncio.Event()
+
+    def send(*msg):
+        try:
+            conn.send(msg)
+        except (BrokenPipeError, EOFError, OSError):
+            stop.set()
+
+    class ChildBus:
+        async def publish(self, topic, data, priority=None):
+            send("publish", topic, data, priority)
+
+        def subscribe(self, topic):
+            q = asyncio.Queue()
+            subs.setdefault(topic, []).append(q)
+            if len(subs[topic]) == 1:
+                send("subscribe", topic)
+            return q
+
+    class ChildCall:
+        def __init__(self, target):
+            self._target = target
+
+        def __getattr__(self, method):
+            return lambda *args: send("call", self._target, method, args)
+
+    def deliver(topic, data):
+        for q in subs.get(topic, []):
+            q.put_nowait(data)
+
+    def reader():
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                loop.call_soon_threadsafe(stop.set)
+                return
+            if msg[0] == "message":
+                loop.call_soon_threadsafe(deliver, msg[1], msg[2])
+            elif msg[0] == "stop":
+                loop.call_soon_threadsafe(stop.set)
+                return
+
+    plugin = load_plugin_class(name, code)(ChildBus(), ChildCall("db"), ChildCall("rules"), meta)
+    threading.Thread(target=reader, name="plugin-ipc", daemon=True).start()
+
+    async def heartbeat():
+        while True:
+            send("heartbeat", getattr(plugin, "last_heartbeat", None) or time.time(), time.process_time(),
+                 plugin.scheduler.min_interval(plugin))
+            await asyncio.sleep(heartbeat_interval)
+
+    tasks = [asyncio.create_task(run_plugin(plugin, name)), asyncio.create_task(heartbeat())]
+    await stop.wait()
+    if hasattr(plugin, "on_stop"):
+        try:
+            await asyncio.wait_for(plugin.on_stop(), timeout=10)
+        except Exception as e:
+            log.error(f"[{name}] error on stop: {e}")
+    for t in tasks:
+        t.cancel()
+
+
+# ───────────────────────────────────────────────────────────────
+# PROCESS MODE — parent side
+# ───────────────────────────────────────────────────────────────
+class ProcessPlugin:
+    """
+    Handle for a plugin running in a child interpreter.
+    Relays bus/rules/db traffic over a pipe and restarts the child if it dies.
+    """
+
+    mode = "process"
+
+    def __init__(self, name, code, meta, bus, db, rules, supervisor=None, heartbeat_interval=5):
+        self.name, self.code, self.meta = name, code, meta
+        self.bus, self.db, self.rules = bus, db, rules
+        self.supervisor = supervisor or Supervisor(name)   # restarts of the worker process
+        self.heartbeat_interval = heartbeat_interval
+        self.last_heartbeat = None
+        self.job_interval = None            # shortest job interval in the child, from its heartbeats
+        self.restarts = 0
+        self.stats = PluginStats(name)      # CPU comes from the child's heartbeats
+        self._cpu_base = 0.0                # CPU of previous (crashed) children
+        self._cpu_child = 0.0
+        self.ipc_dropped = 0                # bus messages not forwarded because the child's outbox was full
+        self.proc = None
+        self.conn = None
+        self._outbox = None                 # bounded queue drained into the pipe by a sender thread
+        self._loop = None
+        self._inbox = None
+        self._tasks = []
+        self._forwarders = {}               # topic → (queue, task)
+        self._stopping = False
+
+    @property
+    def pid(self):
+        return self.proc.pid if self.proc else None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._inbox = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._supervise()), asyncio.create_task(self._pump())]
+
+    async def _supervise(self):
+        ctx = multiprocessing.get_context("spawn")
+        while not self._stopping:
+            parent_conn, child_conn = ctx.Pipe()
+            self.proc = ctx.Process(
+                target=child_main,
+                args=(self.name, self.code, self.meta, child_conn, self.heartbeat_interval),
+                name=f"xs-plugin-{self.name}",
+                daemon=True,
+            )
+            self.proc.start()
+            child_conn.close()
+            started = self.supervisor.begin()
+            self.conn = parent_conn
+            self._outbox = queue.Queue(maxsize=PLUGIN_IPC_QUEUE)
+            threading.Thread(target=self._reader, args=(parent_conn,), name=f"ipc-{self.name}", daemon=True).start()
+            threading.Thread(target=self._writer, args=(parent_conn, self._outbox),
+                             name=f"ipc-send-{self.name}", daemon=True).start()
+            log.info(f"[{self.name}] started in worker process pid={self.proc.pid}")
+
+            while self.proc.is_alive():
+                await asyncio.sleep(1)
+            self._drop_forwarders()
+            if self._stopping:
+                break
+            self._cpu_base += self._cpu_child
+            self._cpu_child = 0.0
+            await self.supervisor.crashed(f"worker process exited (code {self.proc.exitcode})", started)
+            self.restarts += 1
+
+    def _reader(self, conn):
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                return
+            self._loop.call_soon_threadsafe(self._inbox.put_nowait, msg)
+
+    @staticmethod
+    def _writer(conn, outbox):
+        """Blocking pipe writes happen here, never on the main loop. None ends the thread."""
+        while (msg := outbox.get()) is not None:
+            try:
+                conn.send(msg)
+            except (BrokenPipeError, OSError):
+                return
+
+    def _send(self, msg):
+        """Queue a message for the child. Returns False if its outbox is full (child not reading)."""
+        try:
+            self._outbox.put_nowait(msg)
+            return True
+        except queue.Full:
+            return False
+
+    async def _pump(self):
+        """Apply child requests in arrival order on the main loop."""
+        while True:
+            msg = await self._inbox.get()
+            try:
+                kind = msg[0]
+                if kind == "publish":
+                    self.stats.published += 1
+                    await self.bus.publish(msg[1], msg[2], msg[3])
+                elif kind == "subscribe":
+                    self._forward(msg[1])
+                elif kind == "call":
+                    target = {"db": self.db, "rules": self.rules}[msg[1]]
+                    getattr(target, msg[2])(*msg[3])
+                elif kind == "heartbeat":
+                    self.last_heartbeat = msg[1]
+                    self._cpu_child = msg[2]
+                    self.job_interval = msg[3]
+                    self.stats.cpu_s = self._cpu_base + self._cpu_child
+            except Exception as e:
+                log.error(f"[{self.name}] IPC request {msg[0]} failed: {e}")
+
+    def _forward(self, topic):
+        if topic in self._forwarders:
+            return
+        q = self.bus.subscribe(topic)
+
+        async def forward():
+            while True:
+                item = await q.get()
+                self.stats.consumed += 1
+                if not self._send(("message", topic, item)):
+                    self.ipc_dropped += 1
+                    if self.ipc_dropped % 1000 == 1:
+                        log.warning(f"[{self.name}] worker not reading — {self.ipc_dropped} messages dropped so far")
+
+        self._forwarders[topic] = (q, asyncio.create_task(forward()))
+
+    def _drop_forwarders(self):
+        for topic, (q, task) in self._forwarders.items():
+            task.cancel()
+            self.bus.unsubscribe(topic, q)
+        self._forwarders = {}
+        if self._outbox is not None:
+            try:
+                self._outbox.put_nowait(None)
+            except queue.Full:          # the writer is stuck on a dead pipe; it exits with the child
+                pass
+
+    async def on_stop(self):
+        self._stopping = True
+        if self.proc and self.proc.is_alive():
+            self._send(("stop",))
+            await asyncio.to_thread(self.proc.join, 10)
+            if self.proc.is_alive():
+                self.proc.terminate()
+        self._drop_forwarders()
+        for t in self._tasks:
+            t.cancel()
@@ -1,40 +1,355 @@
-import importlib.util, yaml, asyncio, logging, hashlib, os
+import importlib, yaml, asyncio, logging, hashlib, os, json, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from edgeos_core import plugin_host
+from edgeos_core.data_bus import topic_matches
+from edgeos_core.scheduler import Scheduler
+from edgeos_core.accounting import PluginStats, run_accounted
+from edgeos_core.supervisor import Supervisor
 log = logging.getLogger("PluginManager")
 
 class PluginManager:
-    def __init__(self, bus, db, rules, sa):
+    def __init__(self, bus, db, rules, sa, cache_path=None, workers=None, scheduler=None):
         self.bus, self.db, self.rules, self.sa = bus, db, rules, sa
+        self.scheduler = scheduler or Scheduler()   # periodic jobs of inproc plugins
+        self.scheduler.instrument = self._instrument
         self.plugins = {}
+        self.tasks = {}                 # name → supervising task (inproc plugins)
+        self.buses = {}                 # name → PluginBus (inproc plugins)
+        self.lazy = {}                  # name → (code, meta), imported on first trigger
+        self.timings = {}               # name → per-phase load timings (ms)
+        self.stats = {}                 # name → PluginStats (CPU, wall, messages, slow steps)
+        self._owner_stats = {}          # id(plugin) → PluginStats, for scheduler jobs
+        self.supervisors = {}           # name → Supervisor, kept across reloads
+        self.disabled = {}              # name → reason, plugins taken down by an open circuit
+        self.cache_path = cache_path or os.getenv("PLUGIN_CACHE_PATH", os.path.join("plugins", ".manifest_cache.json"))
+        self.workers = workers or min(8, (os.cpu_count() or 2) * 2)
+        bus.subscribe_hooks.append(self._on_subscribe)
 
+    # ───────────────────────────────────────────────────────────────
     async def load_all(self):
+        """
+        Scan plugins/: manifests are parsed (cached by mtime) and bundles verified
+        in a thread pool, then eager plugins are started and `lazy: true` ones deferred.
+        """
+        started = time.perf_counter()
         pdir = os.path.join(os.getcwd(), "plugins")
-        for d in os.listdir(pdir):
-            if not os.path.isdir(os.path.join(pdir, d)):
+        dirs = [d for d in sorted(os.listdir(pdir)) if os.path.isfile(os.path.join(pdir, d, "plugin.yaml"))]
+
+        cache = await asyncio.to_thread(self._load_cache)
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="plugin-scan") as pool:
+            scans = await asyncio.gather(*(
+                loop.run_in_executor(pool, self._scan, pdir, d, cache.get(d)) for d in dirs
+            ))
+
+        new_cache = {}
+        for d, code, entry, timing in scans:
+            if entry is None:
                 continue
-            man = os.path.join(pdir, d, "plugin.yaml")
-            if not os.path.exists(man):
+            new_cache[d] = {"key": entry["key"], "meta": entry["meta"]}
+            self.timings[d] = timing
+            if not entry["verified"]:
+                log.warning(f"Plugin {d} failed verification — not loaded")
+                timing["state"] = "rejected"
                 continue
-            meta = yaml.safe_load(open(man))
-            code = os.path.join(pdir, d, "main.py")
-            if self.sa.verify_plugin(code):
-                spec = importlib.util.spec_from_file_location(d, code)
-                mod = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(mod)
-                plugin = mod.Plugin(self.bus, self.db, self.rules, meta)
-                self.plugins[d] = plugin
-                # Launch each plugin in its own async task, supervised
-                asyncio.create_task(self.safe_start(plugin))
-                log.info(f"Loaded plugin {d}")
+            meta = entry["meta"]
+            if meta.get("lazy"):
+                self.lazy[d] = (code, meta)
+                timing["state"] = "lazy"
+                log.info(f"Deferred plugin {d} (lazy, triggers={meta.get('triggers', [])})")
+            else:
+                self._start(d, code, meta)
+
+        await asyncio.to_thread(self._save_cache, new_cache)
+        log.info(f"Plugins ready in {(time.perf_counter() - started) * 1000:.0f} ms "
+                 f"({len(self.plugins)} started, {len(self.lazy)} lazy)")
+
+    def _scan(self, pdir, d, cached):
+        """Read + verify one plugin's manifest and code (runs in the scan pool)."""
+        man = os.path.join(pdir, d, "plugin.yaml")
+        code = os.path.join(pdir, d, "main.py")
+        timing = {"cached": False}
+        try:
+            key = [os.path.getmtime(man), os.path.getmtime(code) if os.path.exists(code) else None]
+            t0 = time.perf_counter()
+            if cached and cached.get("key") == key:
+                timing["cached"] = True
+                meta = cached["meta"]
             else:
-                log.warning(f"SHA mismatch on {d}")
+                meta = yaml.safe_load(open(man))
+            timing["manifest_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+            # Always verified (never taken from the cache); unchanged files cost a stat each
+            t0 = time.perf_counter()
+            verified = self.sa.verify_plugin(os.path.join(pdir, d))
+            timing["verify_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+            return d, code, {"key": key, "meta": meta, "verified": verified}, timing
+        except Exception as e:
+            log.error(f"Failed to read plugin {d}: {e}")
+            return d, code, None, timing
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self, cache):
+        try:
+            with open(self.cache_path, "w") as f:
+                json.dump(cache, f, default=str)
+        except OSError as e:
+            log.warning(f"Could not write plugin cache {self.cache_path}: {e}")
+
+    # ───────────────────────────────────────────────────────────────
+    def _start(self, d, code, meta, state=None):
+        t0 = time.perf_counter()
+        mode = meta.get("mode", "inproc")
+        if mode == "process":
+            # Child interpreter with IPC bridge, heartbeats and crash restarts
+            plugin = plugin_host.ProcessPlugin(d, code, meta, self.bus, self.db, self.rules, self.supervisor_for(d))
+            plugin.start()
+            stats = plugin.stats
+        elif mode == "thread":
+            # Own event loop in a dedicated thread
+            plugin = plugin_host.ThreadPlugin(d, code, meta, self.bus, self.db, self.rules, self.supervisor_for(d))
+            plugin.start()
+            stats = plugin.stats
+        else:
+            mod = plugin_host.load_plugin_module(d, code)
+            stats = PluginStats(d)
+            self.buses[d] = plugin_host.PluginBus(self.bus, d, stats)
+            plugin = mod.Plugin(self.buses[d], self.db, self.rules, meta)
+            plugin.scheduler = self.scheduler
+            self._owner_stats[id(plugin)] = stats
+            if state is not None and hasattr(plugin, "set_state"):
+                plugin.set_state(state)
+            # Launch each plugin in its own async task, supervised and accounted step by step
+            self.tasks[d] = asyncio.create_task(run_accounted(self.safe_start(plugin, d), stats))
+        self.plugins[d] = plugin
+        self.stats[d] = stats
+        timing = self.timings.setdefault(d, {})
+        timing["import_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        timing["state"] = "running"
+        log.info(f"Loaded plugin {d} ({mode})")
+
+    # ───────────────────────────────────────────────────────────────
+    # RUNTIME LIFECYCLE (hot reload)
+    # ───────────────────────────────────────────────────────────────
+    async def unload(self, name, drain_timeout=5.0):
+        """
+        Stop one plugin without touching the rest of the runtime:
+        detach its subscriptions, let it drain what is already queued, call
+        on_stop, cancel its task and drop its modules from sys.modules.
+        Returns the plugin's get_state() snapshot (or None) for a handoff.
+        """
+        plugin = self.plugins.pop(name, None)
+        if plugin is None:
+            raise ValueError(f"Plugin {name} is not running")
 
-   
-    async def safe_start(self, plugin):
-        while True:
+        pbus = self.buses.pop(name, None)
+        if pbus:
+            pbus.detach()
+            deadline = time.monotonic() + drain_timeout
+            while pbus.pending() and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+
+        state = None
+        if hasattr(plugin, "get_state"):
+            try:
+                state = plugin.get_state()
+            except Exception as e:
+                log.error(f"[{name}] get_state failed: {e}")
+
+        if hasattr(plugin, "on_stop"):
             try:
-                await plugin.on_start()  # if plugin loop crashes, restart
+                await asyncio.wait_for(plugin.on_stop(), timeout=drain_timeout)
             except Exception as e:
-                log.error(f"[{plugin.meta['name']}] crashed: {e}. Restarting in 2s")
-                await asyncio.sleep(2)
+                log.error(f"[{name}] error on stop: {e}")
+
+        self.scheduler.cancel_owner(plugin)
+        self._owner_stats.pop(id(plugin), None)
+        self.stats.pop(name, None)
+        task = self.tasks.pop(name, None)
+        if task:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        self._purge_modules(name)
+        self.timings.setdefault(name, {})["state"] = "unloaded"
+        log.info(f"Unloaded plugin {name}")
+        return state
+
+    async def load(self, name, state=None):
+        """(Re)read a plugin from disk, verify it and start it."""
+        if name in self.plugins:
+            raise ValueError(f"Plugin {name} is already running")
+        if self.activate(name):
+            return
+        pdir = os.path.join(os.getcwd(), "plugins")
+        if not os.path.isfile(os.path.join(pdir, name, "plugin.yaml")):
+            raise ValueError(f"Unknown plugin: {name}")
+        d, code, entry, timing = await asyncio.to_thread(self._scan, pdir, name, None)
+        if entry is None or not entry["verified"]:
+            raise ValueError(f"Plugin {name} failed verification")
+        self.timings[name] = timing
+        self._start(name, code, entry["meta"], state)
+        self.disabled.pop(name, None)
+
+    async def reload(self, name):
+        """Unload and load one plugin, handing get_state() over to set_state()."""
+        state = await self.unload(name)
+        await self.load(name, state)
+        log.info(f"Reloaded plugin {name}")
+
+    @staticmethod
+    def _purge_modules(name):
+        """Forget any modules imported from the plugin's directory so the next load reads fresh code."""
+        pdir = os.path.join(os.getcwd(), "plugins", name) + os.sep
+        for mod_name, mod in list(sys.modules.items()):
+            if (getattr(mod, "__file__", None) or "").startswith(pdir):
+                del sys.modules[mod_name]
+        importlib.invalidate_caches()
+
+    # ───────────────────────────────────────────────────────────────
+    # SUPERVISION
+    # ───────────────────────────────────────────────────────────────
+    def supervisor_for(self, name):
+        if name not in self.supervisors:
+            self.supervisors[name] = Supervisor(name)
+        return self.supervisors[name]
+
+    async def restart(self, name, reason):
+        """
+        Restart a running plugin after a failure seen from outside (stale heartbeat).
+        If that opens its circuit the plugin is unloaded and stays disabled instead.
+        Returns True if it was restarted.
+        """
+        if self.supervisor_for(name).trip(reason):
+            await self.reload(name)
+            return True
+        await self.unload(name)
+        self.disabled[name] = reason
+        return False
+
+    async def reset(self, name):
+        """Close a plugin's circuit and bring it back if it was disabled."""
+        if name not in self.supervisors:
+            raise ValueError(f"Unknown plugin: {name}")
+        self.supervisors[name].reset()
+        if self.disabled.pop(name, None) is not None:
+            await self.load(name)
+
+    async def check_circuits(self):
+        """Give disabled plugins their half-open attempt once the cooldown is over."""
+        for name in list(self.disabled):
+            sup = self.supervisors[name]
+            if sup.next_attempt and time.time() >= sup.next_attempt:
+                log.info(f"[{name}] circuit cooldown over — trying again")
+                del self.disabled[name]
+                try:
+                    await self.load(name)
+                except Exception as e:
+                    log.error(f"[{name}] half-open load failed: {e}")
+                    self.disabled[name] = str(e)
+                    sup.next_attempt = time.time() + sup.cooldown
+
+    def _instrument(self, job, awaitable):
+        """Scheduler hook: charge a job run to the plugin that registered it."""
+        stats = self._owner_stats.get(id(job.owner))
+        return run_accounted(awaitable, stats, iteration=True) if stats else awaitable
+
+    def heartbeat_timeout(self, name, base):
+        """
+        Seconds without a heartbeat before plugin `name` counts as stale:
+        `base`, or three of its shortest job interval if that is longer
+        (heartbeats come from job runs, so a 60 s job beats every 60 s).
+        """
+        plugin = self.plugins.get(name)
+        if getattr(plugin, "mode", "inproc") == "process":
+            interval = plugin.job_interval
+        else:
+            owner = getattr(plugin, "plugin", plugin) if getattr(plugin, "mode", None) == "thread" else plugin
+            sched = getattr(owner, "scheduler", None)
+            interval = sched.min_interval(owner) if sched is not None else None
+        return max(base, 3 * interval) if interval else base
+
+    def get_accounting(self):
+        return {name: stats.to_dict() for name, stats in self.stats.items()}
+
+    def activate(self, name):
+        """
+        Start a deferred (lazy) plugin now. Returns True if it was started.
+        If its import or constructor raises, it is moved to `disabled` with
+        the error (so it stays in /status and `reset` / plugin_load retry it)
+        and the exception propagates.
+        """
+        pending = self.lazy.get(name)
+        if pending is None:
+            return False
+        try:
+            self._start(name, *pending)
+        except Exception as e:
+            self.disabled[name] = f"lazy start failed: {e}"
+            self.supervisor_for(name)
+            self.timings.setdefault(name, {})["state"] = "failed"
+            raise
+        finally:
+            del self.lazy[name]
+        return True
+
+    def _on_subscribe(self, topic):
+        """DataBus hook: the first subscription to a lazy plugin's trigger topic starts it."""
+        for name, (_, meta) in list(self.lazy.items()):
+            if any(topic_matches(p, topic) for p in meta.get("triggers", [])):
+                log.info(f"Lazy plugin {name} triggered by subscription to {topic}")
+                try:
+                    self.activate(name)
+                except Exception as e:
+                    log.error(f"Lazy plugin {name} failed to start: {e}")
+
+    # ───────────────────────────────────────────────────────────────
+    def register_commands(self, handler):
+        """Expose plugin lifecycle actions on a CommandHandler."""
+        handler.register("plugin_load", self._cmd_load, concurrency=1)
+        handler.register("plugin_unload", self._cmd_unload, concurrency=1)
+        handler.register("plugin_reload", self._cmd_reload, concurrency=1)
+        handler.register("plugin_reset", self._cmd_reset, concurrency=1)
+
+    async def _cmd_load(self, cmd, progress):
+        name = cmd.get("params", {}).get("name")
+        if name in self.plugins:
+            return f"{name} already running"
+        await self.load(name)
+        return f"{name} started"
+
+    async def _cmd_unload(self, cmd, progress):
+        name = cmd.get("params", {}).get("name")
+        await self.unload(name)
+        return f"{name} unloaded"
+
+    async def _cmd_reload(self, cmd, progress):
+        name = cmd.get("params", {}).get("name")
+        await self.reload(name)
+        return f"{name} reloaded"
+
+    async def _cmd_reset(self, cmd, progress):
+        name = cmd.get("params", {}).get("name")
+        await self.reset(name)
+        return f"{name} reset"
+
+    def get_status(self):
+        return {
+            "plugins": list(self.plugins.keys()),
+            "lazy": list(self.lazy.keys()),
+            "disabled": self.disabled,
+            "supervisors": {name: sup.to_dict() for name, sup in self.supervisors.items()},
+            "verification": dict(self.sa.digest_stats, enabled=self.sa.verify_enabled),
+            "load_timings": self.timings,
+            "jobs": self.scheduler.get_stats(),
+        }
 
 
+    async def safe_start(self, plugin, name=None):
+        # crashes restart with backoff until the circuit opens; a normal return ends supervision
+        await self.supervisor_for(name or plugin.meta["name"]).run(plugin.on_start)
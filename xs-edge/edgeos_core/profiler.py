@@ -0,0 +1,175 @@
+import asyncio, collections, html, logging, os, sys, threading, time, traceback, zlib
+from edgeos_core import metrics
+
+log = logging.getLogger("LoopMonitor")
+
+LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", 250))
+LAG_INTERVAL_MS = float(os.getenv("LOOP_LAG_INTERVAL_MS", 500))
+
+STALLS = metrics.counter("xs_loop_stalls_total", "Event loop stalls longer than the lag threshold")
+
+
+# ───────────────────────────────────────────────────────────────
+# LOOP LAG MONITOR
+# ───────────────────────────────────────────────────────────────
+class LoopMonitor:
+    """
+    Watches the event loop from both sides.
+
+    A probe task on the loop sleeps `interval` and records how late it woke
+    up (xs_loop_lag_seconds). A daemon thread checks when the probe last
+    ran; once the loop has not come back for `threshold` seconds it logs the
+    loop thread's current stack and task — the code that is blocking it,
+    caught while it still is — and logs again when the loop recovers.
+    """
+
+    def __init__(self, interval=LAG_INTERVAL_MS / 1000, threshold=LAG_THRESHOLD_MS / 1000):
+        self.interval = interval
+        self.threshold = threshold
+        self.last_tick = time.monotonic()
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.last_stall = None
+        self.loop = None
+        self.thread_id = None
+        self._task = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start the probe on the running loop and the watcher thread."""
+        self.loop = asyncio.get_running_loop()
+        self.thread_id = threading.get_ident()
+        self.last_tick = time.monotonic()
+        self._task = asyncio.create_task(self._probe())
+        threading.Thread(target=self._watch, name="loop-monitor", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _probe(self):
+        loop = self.loop
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.last_tick = time.monotonic()
+            metrics.LOOP_LAG.observe(lag)
+
+    def blocked_for(self):
+        """Seconds the loop is currently overdue (0 while it keeps up)."""
+        return max(0.0, time.monotonic() - self.last_tick - self.interval)
+
+    def _watch(self):
+        stalled = None
+        while not self._stop.wait(min(self.interval, self.threshold) / 2):
+            late = self.blocked_for()
+            if late > self.threshold:
+                if stalled is None:
+                    stalled = self._report(late)
+            elif stalled is not None:
+                stalled["seconds"] = round(self.lag, 3)
+                log.warning(f"[Loop] Event loop recovered after a {self.lag * 1000:.0f} ms stall in {stalled['task']}")
+                stalled = None
+
+    def _report(self, late):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame else ""
+        task = asyncio.current_task(self.loop)
+        name = f"{task.get_name()} ({task.get_coro().__qualname__})" if task else "<loop callback>"
+        self.stalls += 1
+        STALLS.inc()
+        self.last_stall = {"ts": time.time(), "seconds": round(late, 3), "task": name, "stack": stack}
+        log.warning(f"[Loop] Event loop blocked for {late * 1000:.0f} ms in {name}:\n{stack}")
+        return self.last_stall
+
+    def get_stats(self):
+        return {
+            "interval_ms": round(self.interval * 1000),
+            "threshold_ms": round(self.threshold * 1000),
+            "lag_ms": round(self.lag * 1000, 2),
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "blocked_ms": round(self.blocked_for() * 1000, 1),
+            "stalls": self.stalls,
+            "last_stall": self.last_stall,
+        }
+
+
+# ───────────────────────────────────────────────────────────────
+# SAMPLING PROFILER
+# ───────────────────────────────────────────────────────────────
+def sample_stacks(seconds, interval=0.01, thread_ids=None):
+    """
+    Sample thread stacks every `interval` for `seconds` via sys._current_frames().
+    Blocking — run it in a worker thread so the loop being profiled keeps running.
+    Returns a Counter of collapsed stacks ("thread;outer;…;inner") → samples.
+    """
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    counts = collections.Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for tid, frame in sys._current_frames().items():
+            if tid == me or (thread_ids and tid not in thread_ids):
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack.append(names.get(tid, str(tid)))
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return counts
+
+
+def collapsed(counts):
+    """Brendan Gregg's collapsed format, one "stack count" per line (flamegraph.pl, speedscope)."""
+    return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+
+
+def flamegraph_svg(counts, width=1200, row=16, title="XS Edge profile"):
+    """Render collapsed stacks as a self-contained flame graph SVG."""
+    root = {"children": {}, "value": 0}
+    for stack, n in counts.items():
+        root["value"] += n
+        node = root
+        for name in stack.split(";"):
+            node = node["children"].setdefault(name, {"children": {}, "value": 0})
+            node["value"] += n
+
+    total = root["value"] or 1
+    rects, depth = [], 0
+
+    def layout(node, x, level):
+        nonlocal depth
+        depth = max(depth, level)
+        for name, child in sorted(node["children"].items()):
+            w = child["value"] / total * width
+            if w >= 0.5:
+                rects.append((name, child["value"], x, level, w))
+                layout(child, x, level + 1)
+            x += w
+
+    layout(root, 0.0, 0)
+    height = (depth + 1) * row + 30
+    out = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">',
+           f'<text x="4" y="16">{html.escape(title)} — {total} samples</text>']
+    for name, value, x, level, w in rects:
+        y = height - (level + 1) * row
+        hue = zlib.crc32(name.split(" (")[0].encode()) % 40
+        label = html.escape(name)
+        out.append(f'<g><title>{label} — {value} samples ({100 * value / total:.1f}%)</title>'
+                   f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row - 1}" fill="hsl({hue},85%,60%)"/>')
+        chars = int(w / 7)
+        if chars > 3:
+            text = name if len(name) <= chars else name[:chars - 2] + ".."
+            out.append(f'<text x="{x + 3:.1f}" y="{y + row - 4}">{html.escape(text)}</text>')
+        out.append("</g>")
+    out.append("</svg>")
+    return "\n".join(out)
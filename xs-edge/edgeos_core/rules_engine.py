@@ -1,7 +1,10 @@
-import json, logging
+import json, logging, time
+from edgeos_core import metrics
 log=logging.getLogger("Rules")
+EVALUATIONS = metrics.counter("xs_rule_evaluations_total", "Rule condition evaluations")
+TRIGGERS = metrics.counter("xs_rule_triggers_total", "Rules whose condition matched", ["rule"])
 class RulesEngine:
-    def __init__(self,db): self.db=db; self.rules=[]
+    def __init__(self,db): self.db=db; self.rules=[]; self.last_triggered=0.0
     def load(self, path='config/rules_demo.json'):
         try:
             self.rules = json.load(open(path))
@@ -13,8 +16,11 @@ class RulesEngine:
             try:
                 # Only evaluate if all variables in the rule exist in ctx
                 if all(var in ctx for var in r["if"].replace(">", " ").replace("<", " ").split() if var.isidentifier()):
+                    EVALUATIONS.inc()
                     if eval(r["if"], {}, ctx):
+                        TRIGGERS.labels(r['name']).inc()
                         log.warning(f"Rule {r['name']} triggered")
+                        self.last_triggered = time.time()
                         self.db.insert_event(r['name'], ctx)
             except Exception as e:
                 log.error(e)
\ No newline at end of file
@@ -1,4 +1,5 @@
 import json, logging, os
+from edgeos_core import codec
 
 log = logging.getLogger("RulesSync")
 
@@ -16,7 +17,7 @@ class RulesSync:
     async def handle_update(self, payload, edge_id):
         """Process incoming rule updates from the Controller."""
         try:
-            data = json.loads(payload)
+            data = codec.loads(payload)
 
             # Support both formats:
             # 1. {"rules": [...]}
@@ -0,0 +1,182 @@
+import asyncio, heapq, inspect, itertools, logging, random, time
+
+log = logging.getLogger("Scheduler")
+
+
+class Job:
+    """A periodic job registered with the Scheduler."""
+
+    def __init__(self, name, fn, interval, jitter, deadline, max_concurrency, owner):
+        self.name = name
+        self.fn = fn
+        self.interval = float(interval)
+        self.jitter = float(jitter)              # fraction of interval, applied ± per run
+        self.deadline = deadline                 # max seconds per run (None = unbounded)
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.owner = owner                       # plugin object; gets last_heartbeat per completed run
+        self.base = 0.0                          # drift-free schedule (monotonic)
+        self.running = 0
+        self.cancelled = False
+        self.stats = {"runs": 0, "failures": 0, "overruns": 0, "deadline_misses": 0,
+                      "skipped": 0, "missed": 0, "last_ms": 0.0, "avg_ms": 0.0, "max_ms": 0.0,
+                      "last_run": None}
+
+    def fire_time(self):
+        if not self.jitter:
+            return self.base
+        return self.base + random.uniform(-self.jitter, self.jitter) * self.interval
+
+    def to_dict(self):
+        return {
+            "owner": getattr(self.owner, "meta", {}).get("name") if self.owner is not None else None,
+            "interval": self.interval,
+            "running": self.running,
+            **self.stats,
+        }
+
+
+class Scheduler:
+    """
+    Single timer heap for periodic plugin work.
+
+    Jobs keep a drift-free base schedule (base += interval), start at a random
+    phase within their first interval so equal-period jobs don't fire in
+    lockstep, and get ± jitter per run. A job whose previous run is still
+    going is skipped once max_concurrency is reached; runs longer than the
+    interval count as overruns, runs past `deadline` are cancelled.
+    A run that completes (even by raising) stamps owner.last_heartbeat;
+    failures are counted on the job, only a run past its deadline does not.
+    """
+
+    def __init__(self):
+        self.jobs = {}                  # name → Job
+        self._heap = []                 # (fire_time, seq, job)
+        self._seq = itertools.count()
+        self._wake = None
+        self._task = None
+        self.instrument = None          # optional (job, awaitable) → awaitable, e.g. per-plugin accounting
+
+    # ───────────────────────────────────────────────────────────────
+    def every(self, interval, fn, name=None, owner=None, jitter=0.1, deadline=None,
+              max_concurrency=1, first_run=None):
+        """
+        Run `fn` (sync or async, no arguments) every `interval` seconds.
+        Re-registering a name replaces the previous job.
+        """
+        name = name or getattr(fn, "__qualname__", repr(fn))
+        if name in self.jobs:
+            self.cancel(name)
+        job = Job(name, fn, interval, jitter, deadline, max_concurrency, owner)
+        now = time.monotonic()
+        job.base = now + (first_run if first_run is not None else random.uniform(0, job.interval))
+        self.jobs[name] = job
+        heapq.heappush(self._heap, (job.fire_time(), next(self._seq), job))
+        if self._wake:
+            self._wake.set()
+        log.debug(f"[Scheduler] Registered {name} every {interval}s")
+        return job
+
+    def cancel(self, name):
+        job = self.jobs.pop(name, None)
+        if job:
+            job.cancelled = True
+
+    def cancel_owner(self, owner):
+        """Cancel every job registered by `owner` (used on plugin unload)."""
+        for name, job in list(self.jobs.items()):
+            if job.owner is owner:
+                self.cancel(name)
+
+    # ───────────────────────────────────────────────────────────────
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run(self):
+        self._wake = asyncio.Event()
+        while True:
+            if not self._heap:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            when, _, job = self._heap[0]
+            if job.cancelled:
+                heapq.heappop(self._heap)
+                continue
+            delay = when - time.monotonic()
+            if delay > 0:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            self._dispatch(job)
+
+            now = time.monotonic()
+            job.base += job.interval
+            if job.base < now:
+                # loop stalled or job fell behind — skip missed ticks instead of bursting
+                missed = int((now - job.base) // job.interval) + 1
+                job.stats["missed"] += missed
+                job.base += missed * job.interval
+            heapq.heappush(self._heap, (job.fire_time(), next(self._seq), job))
+
+    def _dispatch(self, job):
+        if job.running >= job.max_concurrency:
+            job.stats["skipped"] += 1
+            return
+        job.running += 1
+        asyncio.create_task(self._run_job(job))
+
+    async def _run_job(self, job):
+        t0 = time.perf_counter()
+        try:
+            result = job.fn()
+            if inspect.isawaitable(result):
+                if self.instrument:
+                    result = self.instrument(job, result)
+                if job.deadline:
+                    await asyncio.wait_for(result, job.deadline)
+                else:
+                    await result
+            self._beat(job)
+        except asyncio.TimeoutError:
+            job.stats["deadline_misses"] += 1
+            log.warning(f"[Scheduler] {job.name} exceeded its {job.deadline}s deadline")
+        except Exception as e:
+            job.stats["failures"] += 1
+            log.error(f"[Scheduler] {job.name} failed: {e}")
+            self._beat(job)
+        finally:
+            job.running -= 1
+            elapsed = time.perf_counter() - t0
+            st = job.stats
+            st["runs"] += 1
+            st["last_ms"] = round(elapsed * 1000, 2)
+            st["avg_ms"] += (st["last_ms"] - st["avg_ms"]) / st["runs"]
+            st["max_ms"] = max(st["max_ms"], st["last_ms"])
+            st["last_run"] = time.time()
+            if elapsed > job.interval:
+                st["overruns"] += 1
+
+    @staticmethod
+    def _beat(job):
+        if job.owner is not None:
+            job.owner.last_heartbeat = time.time()
+
+    def min_interval(self, owner):
+        """Shortest interval among `owner`'s live jobs, or None if it has none."""
+        return min((j.interval for j in self.jobs.values() if j.owner is owner and not j.cancelled), default=None)
+
+    def get_stats(self):
+        return {name: job.to_dict() for name, job in self.jobs.items()}
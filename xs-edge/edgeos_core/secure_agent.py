@@ -1,14 +1,87 @@
-import hashlib, os, jwt, time, logging
+import hashlib, hmac, json, os, sys, jwt, time, logging
 from dotenv import load_dotenv
+from edgeos_core.token_cache import TokenCache
 
 load_dotenv()
 log = logging.getLogger("SecureAgent")
 
+MANIFEST_NAME = "plugin.sig.json"
+CHUNK_SIZE = 1 << 20
+
+
+def _stat_key(path):
+    # ctime is included because it cannot be set from user space (mtime can, via utime)
+    st = os.stat(path)
+    return (st.st_size, st.st_mtime_ns, st.st_ctime_ns, st.st_ino)
+
+
+def stream_digest(path):
+    """SHA-256 of a file, read in 1 MiB chunks so large bundles are never held in memory."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def bundle_files(plugin_dir):
+    """Files that make up a plugin bundle, relative to its directory (caches and the manifest excluded)."""
+    out = []
+    for root, dirs, files in os.walk(plugin_dir):
+        dirs[:] = [d for d in dirs if d != "__pycache__" and not d.startswith(".")]
+        for fn in files:
+            if fn == MANIFEST_NAME or fn.startswith(".") or fn.endswith(".pyc"):
+                continue
+            out.append(os.path.relpath(os.path.join(root, fn), plugin_dir).replace(os.sep, "/"))
+    return sorted(out)
+
+
+def purge_bytecode(plugin_dir):
+    """
+    Delete compiled bytecode inside a bundle. Python would run a __pycache__
+    .pyc whose header matches the source, so unsigned bytecode must never
+    survive verification. Returns the number of files removed.
+    """
+    removed = 0
+    for root, dirs, files in os.walk(plugin_dir):
+        for fn in files:
+            if fn.endswith(".pyc"):
+                os.remove(os.path.join(root, fn))
+                removed += 1
+    return removed
+
+
+def sign_files(files, secret):
+    """HMAC-SHA256 over the canonical JSON of {relative path: sha256}."""
+    body = json.dumps(files, sort_keys=True, separators=(",", ":")).encode()
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def sign_plugin(plugin_dir, secret):
+    """Write plugin.sig.json for a plugin bundle. Returns the manifest."""
+    files = {rel: stream_digest(os.path.join(plugin_dir, rel)) for rel in bundle_files(plugin_dir)}
+    manifest = {"files": files, "signed_at": time.time(), "signature": sign_files(files, secret)}
+    with open(os.path.join(plugin_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
 class SecureAgent:
     def __init__(self):
         self.secret = os.getenv("PLUGIN_SIGNING_KEY", "key")
         self.jwt_key = os.getenv("EDGE_TOKEN", None)
         self.dev_mode = os.getenv("DEV_MODE", "true").lower() == "true"
+        # Opt-in: bundled plugins ship unsigned, so enable only after running the `sign` step
+        self.verify_enabled = os.getenv("PLUGIN_VERIFY_SHA", "false").lower() == "true"
+        self._digests = {}              # path → ((size, mtime_ns, inode), sha256)
+        self._manifests = {}            # path → ((size, mtime_ns, inode), manifest or None)
+        self.digest_stats = {"hashed": 0, "hits": 0}
+        self.token_cache = TokenCache(
+            size=int(os.getenv("TOKEN_CACHE_SIZE", 1024)),
+            negative_ttl=float(os.getenv("TOKEN_NEGATIVE_TTL", 5)),
+        )
+        if self.verify_enabled and self.secret == "key":
+            log.warning("⚠️  Plugin verification enabled with the default PLUGIN_SIGNING_KEY")
 
         # Automatically issue a token if missing or invalid in dev mode
         if (not self.jwt_key or len(self.jwt_key.split(".")) != 3) and self.dev_mode:
@@ -19,24 +92,81 @@ class SecureAgent:
         else:
             self.current_token = self.jwt_key
 
-    def verify_plugin(self, path):
-        if os.getenv("PLUGIN_VERIFY_SHA", "false").lower() != "true":
+    # ───────────────────────────────────────────────────────────────
+    # PLUGIN INTEGRITY
+    # ───────────────────────────────────────────────────────────────
+    def verify_plugin(self, plugin_dir):
+        """
+        Check a plugin bundle against its signed manifest (plugin.sig.json):
+        the HMAC over the file list must match PLUGIN_SIGNING_KEY, every listed
+        file must hash to its digest, and no unlisted file may be present
+        (dotfiles excepted). Compiled .pyc files are deleted first, so only the
+        signed sources can run. Digests are cached by (path, size, mtime,
+        ctime, inode), so unchanged files are never re-read.
+        """
+        if not self.verify_enabled:
             return True
+        name = os.path.basename(os.path.normpath(plugin_dir))
         try:
-            data = open(path, "rb").read()
-            digest = hashlib.sha256(data).hexdigest()
-            log.debug(f"SHA256 for {os.path.basename(path)}: {digest[:10]}...")
+            if removed := purge_bytecode(plugin_dir):
+                log.warning(f"[{name}] removed {removed} compiled .pyc file(s) before verification")
+            manifest = self._load_manifest(os.path.join(plugin_dir, MANIFEST_NAME))
+            if manifest is None:
+                log.error(f"[{name}] manifest signature invalid")
+                return False
+            files = manifest["files"]
+            for rel in bundle_files(plugin_dir):
+                if rel not in files:
+                    log.error(f"[{name}] unsigned file in bundle: {rel}")
+                    return False
+            for rel, expected in files.items():
+                if not hmac.compare_digest(self.file_digest(os.path.join(plugin_dir, rel)), expected):
+                    log.error(f"[{name}] digest mismatch for {rel}")
+                    return False
             return True
+        except FileNotFoundError as e:
+            log.error(f"[{name}] {e.filename and os.path.basename(e.filename)} missing — plugin not signed?")
+            return False
         except Exception as e:
-            log.error(e)
+            log.error(f"[{name}] verification failed: {e}")
             return False
 
+    def _load_manifest(self, path):
+        """Parse and authenticate a signed manifest (cached by stat). Returns None if the HMAC is wrong."""
+        key = _stat_key(path)
+        cached = self._manifests.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+        with open(path) as f:
+            manifest = json.load(f)
+        if not hmac.compare_digest(sign_files(manifest.get("files", {}), self.secret), manifest.get("signature", "")):
+            manifest = None
+        self._manifests[path] = (key, manifest)
+        return manifest
+
+    def file_digest(self, path):
+        """SHA-256 of a file, recomputed only when its (size, mtime, ctime, inode) changes."""
+        key = _stat_key(path)
+        cached = self._digests.get(path)
+        if cached and cached[0] == key:
+            self.digest_stats["hits"] += 1
+            return cached[1]
+        digest = stream_digest(path)
+        self._digests[path] = (key, digest)
+        self.digest_stats["hashed"] += 1
+        return digest
+
     def verify_token(self, token):
+        cached = self.token_cache.get(token)
+        if cached is not None:
+            return cached
         try:
-            jwt.decode(token, self.jwt_key, algorithms=["HS256"])
+            claims = jwt.decode(token, self.jwt_key, algorithms=["HS256"])
+            self.token_cache.put(token, True, claims.get("exp"))
             return True
         except Exception as e:
-            log.error(e)
+            self.token_cache.put(token, False)
+            self.token_cache.failure(e)
             return False
 
     def issue_token(self):
@@ -45,3 +175,16 @@ class SecureAgent:
             self.jwt_key,
             algorithm="HS256"
         )
+
+
+# ───────────────────────────────────────────────────────────────
+# python -m edgeos_core.secure_agent sign plugins/<name> [...]
+# ───────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "sign":
+        print("usage: python -m edgeos_core.secure_agent sign <plugin_dir> [...]")
+        sys.exit(1)
+    key = os.getenv("PLUGIN_SIGNING_KEY", "key")
+    for d in sys.argv[2:]:
+        m = sign_plugin(d, key)
+        print(f"signed {d}: {len(m['files'])} files")
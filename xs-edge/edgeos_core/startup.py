@@ -0,0 +1,92 @@
+import collections, contextlib, json, logging, os, time
+
+log = logging.getLogger("Startup")
+
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "xsedge.snapshot.json")
+
+
+# ───────────────────────────────────────────────────────────────
+# PHASE TIMINGS
+# ───────────────────────────────────────────────────────────────
+class StartupTimer:
+    """
+    Wall time of each startup phase, in ms. Phases started with timed()
+    run concurrently, so they can add up to more than the total.
+    """
+
+    def __init__(self, t0=None):
+        self.t0 = t0 if t0 is not None else time.perf_counter()
+        self.phases = {}
+        self.total_ms = None
+        if t0 is not None:
+            self.phases["imports"] = round((time.perf_counter() - t0) * 1000, 1)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    async def timed(self, name, awaitable):
+        with self.phase(name):
+            return await awaitable
+
+    def done(self):
+        self.total_ms = round((time.perf_counter() - self.t0) * 1000, 1)
+        log.info(f"[Startup] Ready in {self.total_ms:.0f} ms — "
+                 + ", ".join(f"{k} {v:.0f}" for k, v in self.phases.items()))
+
+    def to_dict(self):
+        return {"total_ms": self.total_ms, "phases": dict(self.phases)}
+
+
+# ───────────────────────────────────────────────────────────────
+# WARM SNAPSHOT
+# ───────────────────────────────────────────────────────────────
+def save_snapshot(path, bus, rules):
+    """Write bus replay buffers and rule state to `path` (atomically)."""
+    if not path:
+        return
+    snapshot = {
+        "saved_at": time.time(),
+        "replay": {topic: list(entries) for topic, entries in bus.replay.items()},
+        "rules": {"rules": rules.rules, "last_triggered": rules.last_triggered},
+    }
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f, default=str)
+        os.replace(tmp, path)
+        log.info(f"[Startup] Snapshot saved → {path} ({len(snapshot['replay'])} topics)")
+    except Exception as e:
+        log.error(f"[Startup] Could not save snapshot {path}: {e}")
+
+
+def restore_snapshot(path, bus, rules):
+    """
+    Refill replay buffers and rule state from a snapshot, so subscribers and
+    live streams have recent history straight after boot. Rules come from
+    the snapshot only when the rules file could not be loaded.
+    Returns the number of topics restored.
+    """
+    if not path or not os.path.exists(path):
+        return 0
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except Exception as e:
+        log.warning(f"[Startup] Ignoring unreadable snapshot {path}: {e}")
+        return 0
+
+    for topic, entries in snapshot.get("replay", {}).items():
+        bus.replay[topic] = collections.deque(((ts, data) for ts, data in entries), maxlen=bus.replay_limit)
+    state = snapshot.get("rules", {})
+    rules.last_triggered = max(rules.last_triggered, state.get("last_triggered") or 0.0)
+    if not rules.rules and state.get("rules"):
+        rules.rules = state["rules"]
+        log.info(f"[Startup] Restored {len(rules.rules)} rules from snapshot")
+    age = time.time() - snapshot.get("saved_at", time.time())
+    log.info(f"[Startup] Warm start: {len(snapshot.get('replay', {}))} replay buffers from {path} ({age:.0f} s old)")
+    return len(snapshot.get("replay", {}))
@@ -0,0 +1,161 @@
+import asyncio, collections, logging, os, random, time
+
+log = logging.getLogger("Supervisor")
+
+RESTART_BASE = float(os.getenv("PLUGIN_RESTART_BASE", 1))
+RESTART_MAX = float(os.getenv("PLUGIN_RESTART_MAX", 60))
+RESTART_INTENSITY = int(os.getenv("PLUGIN_RESTART_INTENSITY", 5))
+RESTART_PERIOD = float(os.getenv("PLUGIN_RESTART_PERIOD", 60))
+CIRCUIT_COOLDOWN = float(os.getenv("PLUGIN_CIRCUIT_COOLDOWN", 300))
+
+
+class Supervisor:
+    """
+    Restart policy for one plugin.
+
+    After a crash the next attempt waits base * 2^(n-1) seconds (capped at
+    max_delay, ±10 % jitter), where n counts consecutive crashes; a run that
+    survives longer than max_delay resets n. More than `intensity` crashes
+    within `period` seconds opens the circuit: the plugin stays disabled
+    (the process keeps running) until `cooldown` has passed — then one
+    half-open attempt is made — or until reset() is called. cooldown=0
+    keeps the circuit open until reset(). A half-open attempt that crashes
+    within max_delay re-opens the circuit straight away.
+
+    States: idle | running | backoff | open | stopped
+    """
+
+    def __init__(self, name, base_delay=None, max_delay=None, intensity=None, period=None, cooldown=None):
+        self.name = name
+        self.base_delay = base_delay if base_delay is not None else RESTART_BASE
+        self.max_delay = max_delay if max_delay is not None else RESTART_MAX
+        self.intensity = intensity if intensity is not None else RESTART_INTENSITY
+        self.period = period if period is not None else RESTART_PERIOD
+        self.cooldown = cooldown if cooldown is not None else CIRCUIT_COOLDOWN
+        self.state = "idle"
+        self.crashes = 0
+        self.restarts = 0
+        self.circuit_opens = 0
+        self.consecutive = 0
+        self.last_error = None
+        self.last_crash = None
+        self.next_attempt = None            # wall-clock time of the next restart, if waiting
+        self._window = collections.deque()  # monotonic crash times within `period`
+        self._probation = False             # current attempt is the half-open one
+        self._reset = None                  # asyncio.Event on the loop the supervised code runs on
+        self._loop = None
+
+    # ───────────────────────────────────────────────────────────────
+    async def run(self, start):
+        """Run `await start()` until it returns normally, restarting it under this policy."""
+        while True:
+            started = self.begin()
+            try:
+                await start()
+                return          # returned normally; the plugin lives on in its scheduler jobs
+            except asyncio.CancelledError:
+                self.state = "stopped"
+                raise
+            except Exception as e:
+                await self.crashed(e, started)
+            self.restarts += 1
+
+    def begin(self):
+        """Mark an attempt as started; returns its monotonic start time for crashed()."""
+        self._probation = self.state == "open"
+        self.state = "running"
+        return time.monotonic()
+
+    async def crashed(self, error, started=None):
+        """Record a crash, then wait out the backoff (or the open circuit) before the next attempt."""
+        now = time.monotonic()
+        survived = started is not None and now - started > self.max_delay
+        half_open = self._probation and not survived
+        if survived:
+            self.consecutive = 0
+        self.crashes += 1
+        self.consecutive += 1
+        self.last_error = str(error)
+        self.last_crash = time.time()
+        self._window.append(now)
+        while self._window and now - self._window[0] > self.period:
+            self._window.popleft()
+
+        if half_open or len(self._window) > self.intensity:
+            await self._open()
+            return
+
+        delay = min(self.base_delay * 2 ** (self.consecutive - 1), self.max_delay)
+        delay *= random.uniform(0.9, 1.1)
+        self.state = "backoff"
+        self.next_attempt = time.time() + delay
+        log.error(f"[{self.name}] crashed ({self.consecutive}× in a row): {error}. Restarting in {delay:.1f}s")
+        await self._wait(delay)
+
+    def trip(self, error):
+        """
+        Count a failure detected from outside (e.g. a stale heartbeat).
+        Returns False when this opens the circuit, i.e. the plugin should stay down.
+        """
+        now = time.monotonic()
+        self.crashes += 1
+        self.last_error = str(error)
+        self.last_crash = time.time()
+        self._window.append(now)
+        while self._window and now - self._window[0] > self.period:
+            self._window.popleft()
+        if len(self._window) > self.intensity:
+            self._mark_open()
+            return False
+        self.restarts += 1
+        return True
+
+    def reset(self):
+        """Close the circuit and clear crash history; a waiting supervisor restarts immediately."""
+        self._window.clear()
+        self.consecutive = 0
+        if self.state == "open":
+            self.state = "idle"
+        if self._loop and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._reset.set)
+        log.info(f"[{self.name}] supervisor reset")
+
+    @property
+    def is_open(self):
+        return self.state == "open"
+
+    # ───────────────────────────────────────────────────────────────
+    def _mark_open(self):
+        self.state = "open"
+        self.circuit_opens += 1
+        self.next_attempt = time.time() + self.cooldown if self.cooldown else None
+        log.error(f"[{self.name}] {len(self._window)} crashes in {self.period:.0f}s — circuit open, plugin disabled"
+                  + (f" for {self.cooldown:.0f}s" if self.cooldown else " until reset"))
+
+    async def _open(self):
+        self._mark_open()
+        await self._wait(self.cooldown or None)
+
+    async def _wait(self, delay):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._reset = loop, asyncio.Event()
+        self._reset.clear()
+        try:
+            await asyncio.wait_for(self._reset.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        self.next_attempt = None
+
+    def to_dict(self):
+        return {
+            "state": self.state,
+            "crashes": self.crashes,
+            "restarts": self.restarts,
+            "consecutive_failures": self.consecutive,
+            "circuit_opens": self.circuit_opens,
+            "crashes_in_window": len(self._window),
+            "last_error": self.last_error,
+            "last_crash": self.last_crash,
+            "next_attempt_in": round(self.next_attempt - time.time(), 1) if self.next_attempt else None,
+        }
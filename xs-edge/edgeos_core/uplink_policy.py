@@ -0,0 +1,160 @@
+import logging, os, time, yaml
+from edgeos_core.data_bus import topic_matches
+
+log = logging.getLogger("UplinkPolicy")
+
+MODES = ("forward", "every_nth", "sample", "deadband", "delta")
+
+
+class TopicPolicy:
+    """
+    One uplink rule from config/uplink.yaml.
+
+      forward    send every message
+      every_nth  send 1 of every `n` messages
+      sample     send at most one message per `interval` seconds
+      deadband   send only when a numeric field moved more than `deadband`
+                 (a number, or a {field: threshold} map) since the last send
+      delta      send numeric differences against the last sent value, with a
+                 full keyframe every `keyframe_every` messages
+
+    `max_interval` (seconds) forces a full send for sample/deadband/delta
+    topics so the controller never goes silent on a slow-moving value.
+    """
+
+    def __init__(self, topic, mode="forward", n=1, interval=0, deadband=0,
+                 keyframe_every=20, max_interval=0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown uplink mode '{mode}' for {topic}")
+        self.topic = topic
+        self.mode = mode
+        self.n = max(int(n), 1)
+        self.interval = float(interval)
+        self.deadband = deadband
+        self.keyframe_every = max(int(keyframe_every), 1)
+        self.max_interval = float(max_interval)
+
+    def _threshold(self, field):
+        if isinstance(self.deadband, dict):
+            return self.deadband.get(field, 0)
+        return self.deadband
+
+    def _moved(self, last, data):
+        if not isinstance(data, dict) or not isinstance(last, dict) or last.keys() != data.keys():
+            return True
+        for k, v in data.items():
+            prev = last[k]
+            if isinstance(v, (int, float)) and isinstance(prev, (int, float)):
+                if abs(v - prev) > self._threshold(k):
+                    return True
+            elif v != prev:
+                return True
+        return False
+
+    @staticmethod
+    def _delta(last, data):
+        if not isinstance(data, dict) or not isinstance(last, dict) or last.keys() != data.keys():
+            return None
+        delta, changed = {}, {}
+        for k, v in data.items():
+            prev = last[k]
+            if isinstance(v, (int, float)) and isinstance(prev, (int, float)) and not isinstance(v, bool):
+                if v != prev:
+                    delta[k] = v - prev
+            elif v != prev:
+                changed[k] = v
+        out = {"_delta": delta}
+        if changed:
+            out["_set"] = changed
+        return out
+
+    def apply(self, state, data, now):
+        """Return the payload to uplink for this message, or None to suppress it."""
+        state["seen"] += 1
+        overdue = self.max_interval and now - state["last_ts"] >= self.max_interval
+
+        if self.mode == "forward":
+            out = data
+        elif self.mode == "every_nth":
+            out = data if (state["seen"] - 1) % self.n == 0 else None
+        elif self.mode == "sample":
+            out = data if overdue or state["last"] is None or now - state["last_ts"] >= self.interval else None
+        elif self.mode == "deadband":
+            out = data if overdue or state["last"] is None or self._moved(state["last"], data) else None
+        else:  # delta
+            keyframe = overdue or state["last"] is None or state["since_key"] + 1 >= self.keyframe_every
+            out = None if keyframe else self._delta(state["last"], data)
+            if out is None:
+                out, state["since_key"] = data, 0
+            elif not out["_delta"] and "_set" not in out:
+                return None  # unchanged — nothing worth sending
+            else:
+                state["since_key"] += 1
+
+        if out is not None:
+            state["last"], state["last_ts"] = data, now
+        return out
+
+
+class UplinkPolicies:
+    """
+    Per-topic uplink filter applied by MQTTBridge before anything is sent.
+    First matching policy wins; topics with no match use `default`.
+    Keeps per-topic state and forwarded/suppressed counters.
+    """
+
+    def __init__(self, policies=None, default=None):
+        self.policies = policies or []
+        self.default = default or TopicPolicy("#")
+        self._resolved = {}            # topic → TopicPolicy
+        self.state = {}                # topic → {"seen", "last", "last_ts", "since_key"}
+        self.stats = {}                # topic → {"forwarded", "suppressed"}
+
+    @classmethod
+    def load(cls, path="config/uplink.yaml"):
+        if not os.path.exists(path):
+            return cls()
+        try:
+            cfg = yaml.safe_load(open(path)) or {}
+            policies = [TopicPolicy(**p) for p in cfg.get("policies", [])]
+            default = TopicPolicy("#", **cfg.get("default", {}))
+            log.info(f"✅ Loaded {len(policies)} uplink policies from {path}")
+            return cls(policies, default)
+        except Exception as e:
+            log.error(f"❌ Failed to load uplink policies from {path}: {e}")
+            return cls()
+
+    def policy_for(self, topic):
+        policy = self._resolved.get(topic)
+        if policy is None:
+            policy = next((p for p in self.policies if topic_matches(p.topic, topic)), self.default)
+            self._resolved[topic] = policy
+        return policy
+
+    def filter(self, topic, data, now=None):
+        """Return the payload to send for `topic`, or None if the policy suppresses it."""
+        state = self.state.get(topic)
+        if state is None:
+            state = self.state[topic] = {"seen": 0, "last": None, "last_ts": 0.0, "since_key": 0}
+            self.stats[topic] = {"forwarded": 0, "suppressed": 0, "resyncs": 0}
+        out = self.policy_for(topic).apply(state, data, now if now is not None else time.time())
+        self.stats[topic]["forwarded" if out is not None else "suppressed"] += 1
+        return out
+
+    def resync(self, topics):
+        """
+        A message for these topics was dropped after filter() let it through.
+        Delta topics lose their baseline, so their next message goes out as a
+        full keyframe instead of a delta the controller cannot apply.
+        """
+        for topic in topics:
+            state = self.state.get(topic)
+            if state is not None and self.policy_for(topic).mode == "delta":
+                state["last"] = None
+                self.stats[topic]["resyncs"] += 1
+
+    def get_stats(self):
+        return {
+            topic: {"mode": self.policy_for(topic).mode, **stat}
+            for topic, stat in self.stats.items()
+        }
@@ -1,11 +1,17 @@
-from fastapi import FastAPI, Request, HTTPException, Security
+from fastapi import FastAPI, Request, HTTPException, Security, WebSocket, WebSocketDisconnect
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import JSONResponse, HTMLResponse
-import os, time, logging, json
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse, Response, PlainTextResponse
+from edgeos_core.local_db import encode_cursor, decode_cursor
+from edgeos_core.bus_stream import BusStream
+from edgeos_core.metrics import REGISTRY, CONTENT_TYPE
+from edgeos_core.healer import HEARTBEAT_TIMEOUT
+from edgeos_core import codec, profiler
+import asyncio, contextlib, csv, io, os, threading, time, logging
+import uvicorn
 
 log = logging.getLogger("WebAPI")
 
-def create_app(pm, db, rules, sa, bus):
+def create_app(pm, db, rules, sa, bus, monitor=None, healer=None, startup=None):
     """
     XS Edge FastAPI app with REST + HTML dashboard.
     """
@@ -23,13 +29,16 @@ def create_app(pm, db, rules, sa, bus):
     async def auth(request: Request, call_next):
         open_paths = [
             "/docs", "/openapi.json", "/status", "/health",
-            "/health/view", "/favicon.ico", "/bus/stats"
+            "/health/view", "/favicon.ico", "/bus/stats", "/scheduler/stats",
+            "/metrics/prom"
         ]
         if request.url.path in open_paths:
             return await call_next(request)
 
-        token_header = request.headers.get("Authorization", "")
-        token = token_header.replace("Bearer ", "").strip()
+        token = request.headers.get("Authorization", "").replace("Bearer ", "").strip()
+        # EventSource clients cannot set headers, so /bus/stream alone also takes ?token=
+        if not token and request.url.path == "/bus/stream":
+            token = request.query_params.get("token", "")
         if not token:
             log.warning(f"Unauthorized access attempt to {request.url.path}")
             return JSONResponse({"detail": "Missing or invalid token"}, status_code=403)
@@ -48,7 +57,8 @@ def create_app(pm, db, rules, sa, bus):
     # ───────────────────────────────────────────────────────────────
     @app.get("/status", tags=["default"])
     async def status():
-        return {"plugins": list(pm.plugins.keys())}
+        return dict(pm.get_status(), auth=sa.token_cache.get_stats(),
+                    startup=startup.to_dict() if startup else None)
 
     start_time = time.time()
 
@@ -59,15 +69,32 @@ def create_app(pm, db, rules, sa, bus):
 
         for name, plugin in pm.plugins.items():
             last_hb = getattr(plugin, "last_heartbeat", None)
+            mode = getattr(plugin, "mode", "inproc")
             if last_hb:
                 delta = round(now - last_hb, 1)
-                status = "OK" if delta < 30 else "STALE"
-                plugin_status[name] = {"last_heartbeat_sec_ago": delta, "status": status}
+                timeout = pm.heartbeat_timeout(name, healer.heartbeat_timeout if healer else HEARTBEAT_TIMEOUT)
+                status = "OK" if delta < timeout else "STALE"
+                plugin_status[name] = {"last_heartbeat_sec_ago": delta, "status": status, "mode": mode}
                 if status == "STALE":
                     degraded = True
             else:
-                plugin_status[name] = {"status": "NO_HEARTBEAT"}
+                plugin_status[name] = {"status": "NO_HEARTBEAT", "mode": mode}
                 degraded = True
+            if mode == "process":
+                plugin_status[name].update(pid=plugin.pid, restarts=plugin.restarts, ipc_dropped=plugin.ipc_dropped)
+            if name in pm.stats:
+                plugin_status[name]["usage"] = pm.stats[name].summary()
+            sup = pm.supervisors.get(name)
+            if sup:
+                plugin_status[name]["supervisor"] = sup.to_dict()
+                if sup.state in ("backoff", "open"):
+                    plugin_status[name]["status"] = "CIRCUIT_OPEN" if sup.is_open else "RESTARTING"
+                    degraded = True
+
+        for name, reason in pm.disabled.items():
+            plugin_status[name] = {"status": "DISABLED", "reason": reason,
+                                   "supervisor": pm.supervisors[name].to_dict()}
+            degraded = True
 
         # MQTT bridge info
         mqtt_info = {"enabled": False}
@@ -80,7 +107,14 @@ def create_app(pm, db, rules, sa, bus):
                     "port": bridge.port,
                     "edge_id": bridge.edge_id,
                     "connected": getattr(bridge, "running", False),
+                    "batching": bridge.frames is not None,
+                    "uplink": dict(bridge.uplink_stats),
+                    "delivery": bridge.get_delivery_stats(),
+                    "commands": bridge.command_handler.get_stats(),
+                    "uplink_policies": bridge.policies.get_stats(),
                 }
+                if bus.aggregator:
+                    mqtt_info["aggregation"] = bus.aggregator.get_stats()
         except Exception as e:
             mqtt_info = {"enabled": False, "error": str(e)}
 
@@ -91,6 +125,8 @@ def create_app(pm, db, rules, sa, bus):
             "overall_status": "OK" if not degraded else "DEGRADED",
             "plugins": plugin_status,
             "mqtt_bridge": mqtt_info,
+            "event_loop": monitor.get_stats() if monitor else None,
+            "recovery": healer.get_stats() if healer else None,
         }
 
     # JSON health (for controller use)
@@ -155,6 +191,77 @@ def create_app(pm, db, rules, sa, bus):
     async def bus_stats():
         return bus.get_stats()
 
+    # Periodic plugin jobs (run time, overruns, skips)
+    @app.get("/scheduler/stats", tags=["default"])
+    async def scheduler_stats():
+        return pm.scheduler.get_stats()
+
+    # Prometheus scrape target. Counters the runtime already keeps (bus,
+    # bridge, plugin accounting, scheduler, supervisors) are read here at
+    # scrape time rather than mirrored on every publish.
+    @REGISTRY.collector
+    def runtime_metrics():
+        bus_stats = bus.get_stats()
+        out = [
+            ("xs_bus_published_total", "counter", "Messages published on the data bus",
+             [({"topic": t}, st["published"]) for t, st in bus_stats.items()]),
+            ("xs_bus_queued", "gauge", "Messages waiting in subscriber queues",
+             [({"topic": t}, st["queued"]) for t, st in bus_stats.items()]),
+            ("xs_bus_subscribers", "gauge", "Subscribers per topic",
+             [({"topic": t}, st["subscribers"]) for t, st in bus_stats.items()]),
+        ]
+
+        bridge = getattr(bus, "bridge", None)
+        if bridge:
+            out.append(("xs_mqtt_connected", "gauge", "1 while the MQTT bridge is connected",
+                        [({}, int(bool(bridge.running)))]))
+            out.append(("xs_uplink_bytes_total", "counter", "Uplink batch bytes before / after encoding",
+                        [({"stage": "raw"}, bridge.uplink_stats["bytes_raw"]),
+                         ({"stage": "sent"}, bridge.uplink_stats["bytes_sent"])]))
+            out.append(("xs_uplink_frames_total", "counter", "Uplink batch frames sent",
+                        [({}, bridge.uplink_stats["frames"])]))
+            delivery = bridge.delivery_stats
+            for key in ("sent", "delivered", "failed", "retries", "dropped"):
+                out.append((f"xs_uplink_{key}_total", "counter", f"Uplink messages {key}, by delivery class",
+                            [({"class": c}, st[key]) for c, st in delivery.items()]))
+
+        usage = {name: st.summary() for name, st in list(pm.stats.items())}
+        for key, kind, help in (
+            ("cpu_ms", "counter", "Plugin CPU time in milliseconds"),
+            ("steps", "counter", "Coroutine steps run per plugin"),
+            ("iterations", "counter", "Scheduled iterations run per plugin"),
+            ("published", "counter", "Bus messages published per plugin"),
+            ("consumed", "counter", "Bus messages consumed per plugin"),
+            ("slow_callbacks", "counter", "Plugin steps over the slow-callback threshold"),
+            ("max_step_ms", "gauge", "Longest single plugin step in milliseconds"),
+        ):
+            out.append((f"xs_plugin_{key}" + ("_total" if kind == "counter" else ""), kind, help,
+                        [({"plugin": n}, u[key]) for n, u in usage.items()]))
+
+        jobs = pm.scheduler.get_stats()
+        for key, kind, help in (
+            ("runs", "counter", "Scheduled job runs"),
+            ("failures", "counter", "Scheduled job failures"),
+            ("overruns", "counter", "Job runs longer than their interval"),
+            ("skipped", "counter", "Job runs skipped at max concurrency"),
+            ("avg_ms", "gauge", "Average job run time in milliseconds"),
+        ):
+            out.append((f"xs_job_{key}" + ("_total" if kind == "counter" else ""), kind, help,
+                        [({"job": n}, j[key]) for n, j in jobs.items()]))
+
+        sups = list(pm.supervisors.items())
+        out.append(("xs_plugin_crashes_total", "counter", "Plugin crashes seen by the supervisor",
+                    [({"plugin": n}, s.crashes) for n, s in sups]))
+        out.append(("xs_plugin_restarts_total", "counter", "Plugin restarts by the supervisor",
+                    [({"plugin": n}, s.restarts) for n, s in sups]))
+        out.append(("xs_plugin_circuit_open", "gauge", "1 while a plugin's restart circuit is open",
+                    [({"plugin": n}, int(s.state == "open")) for n, s in sups]))
+        return out
+
+    @app.get("/metrics/prom", tags=["default"])
+    async def metrics_prom():
+        return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
     # ───────────────────────────────────────────────────────────────
     # PROTECTED ROUTES
     # ───────────────────────────────────────────────────────────────
@@ -164,4 +271,178 @@ def create_app(pm, db, rules, sa, bus):
         events = [dict(zip(["ts", "rule", "data"], r)) for r in cur]
         return {"events": events}
 
+    # Event history: filters, keyset pagination and streaming export
+    def event_filters(topic, rule, since, until):
+        return {
+            "topic": topic,
+            "rules": [r for r in rule.split(",") if r] if rule else None,
+            "since": since,
+            "until": until,
+        }
+
+    @app.get("/events", tags=["events"])
+    async def events(topic: str = None, rule: str = None, since: float = None, until: float = None,
+                     cursor: str = None, limit: int = 100, order: str = "asc",
+                     credentials: HTTPAuthorizationCredentials = Security(security)):
+        """
+        Page through events. `topic` may end in '#' for a prefix match, `rule` takes a comma list,
+        `since` / `until` are epoch seconds. Pass `next_cursor` back as `cursor` for the next page.
+        """
+        try:
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError:
+            raise HTTPException(400, "Invalid cursor")
+        limit = max(1, min(limit, 1000))
+        rows = db.query_events(after=after, limit=limit, desc=order == "desc",
+                               **event_filters(topic, rule, since, until))
+        return {
+            "events": [{"ts": ts, "rule": r, "data": data} for _, ts, r, data in rows],
+            "next_cursor": encode_cursor(rows[-1][1], rows[-1][0]) if len(rows) == limit else None,
+        }
+
+    @app.get("/events/export", tags=["events"])
+    async def export_events(format: str = "ndjson", topic: str = None, rule: str = None,
+                            since: float = None, until: float = None, chunk: int = 1000,
+                            credentials: HTTPAuthorizationCredentials = Security(security)):
+        """Stream every matching event as NDJSON or CSV, read from SQLite one chunk at a time."""
+        if format not in ("ndjson", "csv"):
+            raise HTTPException(400, "format must be ndjson or csv")
+        filters = event_filters(topic, rule, since, until)
+        chunk = max(100, min(chunk, 10000))
+
+        async def body():
+            if format == "csv":
+                yield "ts,rule,data\r\n"
+            for rows in db.iter_events(chunk=chunk, **filters):
+                if format == "csv":
+                    buf = io.StringIO()
+                    csv.writer(buf).writerows((ts, r, data) for _, ts, r, data in rows)
+                    yield buf.getvalue()
+                else:
+                    yield "".join(codec.dumps_str({"ts": ts, "rule": r, "data": data}) + "\n" for _, ts, r, data in rows)
+                await asyncio.sleep(0)      # let the bus run between chunks
+
+        media = "text/csv" if format == "csv" else "application/x-ndjson"
+        return StreamingResponse(body(), media_type=media, headers={
+            "Content-Disposition": f"attachment; filename=events.{format}"})
+
+    # Live bus: SSE and WebSocket, wildcard topics, optional replay, batched per interval
+    @app.get("/bus/stream", tags=["bus"])
+    async def bus_stream(topics: str = "#", replay: int = 0, interval_ms: int = 250, buffer: int = 1000,
+                         credentials: HTTPAuthorizationCredentials = Security(security)):
+        stream = BusStream.from_params(bus, topics, replay, interval_ms, buffer).open()
+
+        async def events():
+            try:
+                async for frame in stream.batches():
+                    yield f"data: {frame}\n\n"
+            finally:
+                stream.close()
+
+        return StreamingResponse(events(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @app.websocket("/bus/ws")
+    async def bus_ws(ws: WebSocket, topics: str = "#", replay: int = 0, interval_ms: int = 250,
+                     buffer: int = 1000, token: str = ""):
+        # the HTTP auth middleware does not see WebSocket handshakes
+        token = ws.headers.get("Authorization", "").replace("Bearer ", "").strip() or token
+        if not token or not sa.verify_token(token):
+            await ws.close(code=1008)
+            return
+        await ws.accept()
+        stream = BusStream.from_params(bus, topics, replay, interval_ms, buffer).open()
+        log.info(f"[API] Bus stream opened: {stream.patterns}")
+
+        async def pump():
+            async for frame in stream.batches():
+                await ws.send_text(frame)
+
+        async def watch():
+            # notices a disconnect even while the topics are quiet
+            while (await ws.receive())["type"] != "websocket.disconnect":
+                pass
+
+        tasks = [asyncio.create_task(pump()), asyncio.create_task(watch())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            for t in tasks:
+                t.cancel()
+            stream.close()
+            log.info(f"[API] Bus stream closed: {stream.patterns} (sent {stream.sent}, dropped {stream.dropped})")
+
+    # Per-plugin CPU / wall / message accounting, with stacks of slow steps
+    @app.get("/plugins/stats", tags=["plugins"])
+    async def plugin_stats(credentials: HTTPAuthorizationCredentials = Security(security)):
+        return pm.get_accounting()
+
+    # On-demand sampling profiler: samples thread stacks from a worker thread
+    # for `seconds` while the loop keeps serving, one profile at a time.
+    profiling = asyncio.Lock()
+
+    @app.get("/debug/profile", tags=["debug"])
+    async def debug_profile(seconds: float = 5, interval_ms: float = 10, threads: str = "loop",
+                            format: str = "collapsed",
+                            credentials: HTTPAuthorizationCredentials = Security(security)):
+        if format not in ("collapsed", "svg"):
+            raise HTTPException(status_code=400, detail="format must be collapsed or svg")
+        if threads not in ("loop", "all"):
+            raise HTTPException(status_code=400, detail="threads must be loop or all")
+        if profiling.locked():
+            raise HTTPException(status_code=409, detail="A profile is already running")
+        seconds = max(0.1, min(seconds, 60))
+        interval = max(1, min(interval_ms, 1000)) / 1000
+        thread_ids = {threading.get_ident()} if threads == "loop" else None
+        async with profiling:
+            log.info(f"[API] Profiling {threads} thread(s) for {seconds}s")
+            counts = await asyncio.to_thread(profiler.sample_stacks, seconds, interval, thread_ids)
+        if format == "svg":
+            return Response(profiler.flamegraph_svg(counts), media_type="image/svg+xml")
+        return PlainTextResponse(profiler.collapsed(counts))
+
+    # Plugin lifecycle (hot reload)
+    @app.post("/plugins/{name}/{action}", tags=["plugins"])
+    async def plugin_action(name: str, action: str, credentials: HTTPAuthorizationCredentials = Security(security)):
+        ops = {"load": pm.load, "unload": pm.unload, "reload": pm.reload, "reset": pm.reset}
+        if action not in ops:
+            raise HTTPException(404, f"Unknown action: {action}")
+        try:
+            await ops[action](name)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        return {"plugin": name, "action": action, "status": "ok", "plugins": list(pm.plugins.keys())}
+
     return app
+
+
+# ───────────────────────────────────────────────────────────────
+# API SERVER
+# ───────────────────────────────────────────────────────────────
+class APIServer(uvicorn.Server):
+    """uvicorn.Server that leaves SIGINT / SIGTERM to main()."""
+
+    def capture_signals(self):
+        return contextlib.nullcontext()
+
+
+async def serve_api(app, port, stop_event):
+    """
+    Serve the API on this loop, next to the bus, so handlers read plugin,
+    bus and DB state without crossing threads. Restarts the server if it
+    ever stops on its own.
+    """
+    while not stop_event.is_set():
+        server = APIServer(uvicorn.Config(app, host="0.0.0.0", port=port, log_level="info"))
+        serving = asyncio.create_task(server.serve())
+        stopping = asyncio.create_task(stop_event.wait())
+        await asyncio.wait({serving, stopping}, return_when=asyncio.FIRST_COMPLETED)
+        if stop_event.is_set():
+            server.should_exit = True
+            await serving
+            return
+        stopping.cancel()
+        log.error("💥 API server stopped — restarting it in 5 s")
+        await asyncio.sleep(5)
@@ -1,4 +1,4 @@
-import asyncio, random, logging, time
+import random, logging
 
 class Plugin:
     def __init__(self, bus, db, rules, meta):
@@ -8,24 +8,20 @@ class Plugin:
         self.meta = meta
 
     async def on_start(self):
-       
-        while True:
-            self.last_heartbeat = time.time()
-            try:
-               
-                level = random.randint(20, 100)
-                ctx = {"energy_level": level}
-                await self.bus.publish("energy/status", ctx)
-                try:
-                    self.rules.evaluate(ctx)
-                except Exception as e:
-                    logging.error(f"[{self.meta['name']}] rule eval error: {e}")
-                logging.info(f"[Energy] level {level}%")
-                await asyncio.sleep(10)
-            except Exception as e:
-                logging.error(f"[Energy Plugin] crash: {e}")
-                await asyncio.sleep(5)
+        # self.scheduler is provided by the plugin host; heartbeats follow successful runs
+        self.scheduler.every(10, self.sample, name=f"{self.meta['name']}.sample",
+                             owner=self, deadline=5)
+
+    async def sample(self):
+        level = random.randint(20, 100)
+        ctx = {"energy_level": level}
+        await self.bus.publish("energy/status", ctx)
+        try:
+            self.rules.evaluate(ctx)
+        except Exception as e:
+            logging.error(f"[{self.meta['name']}] rule eval error: {e}")
+        logging.info(f"[Energy] level {level}%")
 
     async def on_stop(self):
         logging.info(f"[{self.meta['name']}] cleaning up resources...")
-        # perform cleanup, save state, close sockets, etc.
\ No newline at end of file
+        # perform cleanup, save state, close sockets, etc.